@@ -0,0 +1,244 @@
+"""Headless benchmarks of the components and the data pipeline.
+
+Run with `python -m console.benchmark` from the repository root, with the
+package installed or `PYTHONPATH=src:.`.  Results are written as JSON and can
+be compared against a stored baseline, e.g.
+
+    python -m console.benchmark --output baseline.json
+    python -m console.benchmark --baseline baseline.json
+
+The comparison exits with a non-zero status if any case got slower than the
+baseline by more than the threshold.
+"""
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+
+from console.components.base import LinePlot
+from console.components.ca import HexCA3
+from console.components.composite import TextInBorder, AnnotatedLinePlots
+from console.components.solar import SunPath
+from console.data import fake
+from console.data.cache import cache_dir
+from console.data.source import REQUEST_POOL, DataSource, Scheduler
+
+
+GREEN = (10,189,198)
+BLACK = (9,24,51)
+RED = (234,0,217)
+PURPLE = (113,28,145)
+
+TEXT_PARAMS = {
+    'font_name': '3270medium',
+    'font_size': 32,
+    'font_color': GREEN,
+    'font_background': BLACK,
+}
+CONTAINER_PARAMS = {
+    'border_thickness': 2,
+    'border_radius': 10,
+    'border_margin': 10,
+    'border_color': GREEN,
+    'background_color': BLACK,
+    'child_padding': 15,
+}
+
+GRID_SIZES = [(50, 35), (100, 100), (250, 250)]
+HISTORY_LENGTHS = [1_000, 25_920, 259_200]
+NUM_SERIES = [1, 5, 10]
+NUM_ROWS = [5, 20]
+
+
+def time_case(func: Callable, repeats: int, number: int = 1) -> dict[str, float]:
+    """Per-call times of `func` over `repeats` runs of `number` calls."""
+    func()  # warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'repeats': repeats,
+        'number': number,
+    }
+
+
+def synthetic_history(length: int) -> np.ndarray:
+    """Synthetic temperatures from the fake data source."""
+    return np.array([fake.request_data()['Temperature'] for _ in range(length)])
+
+
+def make_ca(size: tuple[int, int], partial_redraw_fraction: float | None = None) -> HexCA3:
+    # Keep simulating through cycles, so every call draws a new generation
+    # rather than occasionally reinitializing
+    ca = HexCA3(*size, 'spiral', {0: GREEN, 1: RED, 2: PURPLE}, BLACK, GREEN, 10, on_cycle='ignore')
+    if partial_redraw_fraction is not None:
+        ca.partial_redraw_fraction = partial_redraw_fraction
+    return ca
+
+
+def make_line_plot(length: int) -> Callable:
+    x_data, y_data = np.arange(length), synthetic_history(length)
+    return lambda: LinePlot(300, 40, x_data, y_data, BLACK, GREEN, 5, 2)
+
+
+def make_annotated_line_plots(num_series: int) -> Callable:
+    x_data = np.arange(HISTORY_LENGTHS[1])
+    y_datas = [synthetic_history(len(x_data)) for _ in range(num_series)]
+    labels = [f'S{i:03d}' for i in range(num_series)]
+    return lambda: AnnotatedLinePlots(labels, x_data, y_datas, TEXT_PARAMS, CONTAINER_PARAMS).render()
+
+
+def make_text_in_border(num_rows: int) -> Callable:
+    rows = [fake.present_data(fake.request_data())[i % 7] for i in range(num_rows)]
+    return lambda: TextInBorder(rows, TEXT_PARAMS, CONTAINER_PARAMS).render()
+
+
+def make_idle_update() -> Callable:
+    """Polling a source that is not due, i.e., the per-frame cost."""
+    source = fake.make_data_source()
+    source.next_due_ns = time.monotonic_ns() + source.refresh_ns
+    return source.update
+
+
+def make_completed_update() -> Callable:
+    """Collecting a completed request, which stores its response."""
+    source = fake.make_data_source()
+    REQUEST_POOL.submit(source.name, fake.request_data).result()
+
+    def update():
+        # The response stays in the pool, so it can be collected again
+        source.pending = True
+        source.update()
+
+    return update
+
+
+def make_idle_scheduler() -> Callable:
+    scheduler = Scheduler()
+    sources = [fake.make_data_source() for _ in range(10)]
+    for source in sources:
+        source.next_due_ns = time.monotonic_ns() + source.refresh_ns
+    scheduler.add(*sources)
+    return scheduler.update
+
+
+def make_store(length: int) -> Callable:
+    source = DataSource('benchmark', fake.request_data, 3*24*60*60 / length)
+    for _ in range(length):
+        source.store(fake.request_data())
+    record = fake.request_data()
+    return lambda: source.store(record)
+
+
+def make_cases() -> dict[str, tuple[Callable[[], Callable], int]]:
+    """Benchmark cases as name -> (factory of the function, number of calls per repeat).
+
+    Cases are only set up once selected, as some of them take a while.
+    """
+    cases = {}
+
+    for size in GRID_SIZES:
+        cases[f'HexCA3.get_surface/{size[0]}x{size[1]}'] = (lambda size=size: make_ca(size).get_surface, 10)
+
+    # Both ways of drawing the changed hexes, whatever the fraction changed
+    for path, fraction in [('partial', 1.0), ('full', 0.0)]:
+        size = GRID_SIZES[0]
+        cases[f'HexCA3.get_surface/{size[0]}x{size[1]}/{path}'] = (
+            lambda size=size, fraction=fraction: make_ca(size, fraction).get_surface,
+            10
+        )
+
+    cases['SunPath.get_surface'] = (lambda: SunPath(500, GREEN, BLACK, RED, 2, 10).get_surface, 10)
+
+    for length in HISTORY_LENGTHS:
+        cases[f'LinePlot/{length}'] = (lambda length=length: make_line_plot(length), 10)
+
+    for num_series in NUM_SERIES:
+        cases[f'AnnotatedLinePlots/{num_series}'] = (lambda num_series=num_series: make_annotated_line_plots(num_series), 5)
+
+    for num_rows in NUM_ROWS:
+        cases[f'TextInBorder/{num_rows}'] = (lambda num_rows=num_rows: make_text_in_border(num_rows), 10)
+
+    cases['DataSource.update/idle'] = (make_idle_update, 1000)
+    cases['DataSource.update/completed'] = (make_completed_update, 1000)
+    cases['Scheduler.update/idle'] = (make_idle_scheduler, 1000)
+
+    for length in HISTORY_LENGTHS:
+        cases[f'DataSource.store/{length}'] = (lambda length=length: make_store(length), 1000)
+
+    return cases
+
+
+def run(repeats: int, pattern: str | None = None) -> dict:
+    pygame.init()
+    results = {}
+    for name, (factory, number) in make_cases().items():
+        if pattern is not None and pattern not in name:
+            continue
+        results[name] = time_case(factory(), repeats, number)
+        print(f'{name:<40}{results[name]["median"]*1e3:10.3f} ms')
+    pygame.quit()
+
+    return {
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+        },
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Names of the cases that are slower than the baseline by more than `threshold`."""
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = result['median'] / baseline['results'][name]['median']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        print(f'{name:<40}{ratio:8.2f}x {flag}')
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=cache_dir('benchmark.json'), help='where to write the results')
+    parser.add_argument('--baseline', help='results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio that counts as a regression')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    args = parser.parse_args()
+
+    results = run(args.repeats, args.filter)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,109 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import functools
 
+import numpy as np
 import pygame
 
+from console.profiler import profiled
+
+
+@functools.cache
+def get_font(font_name: str, font_size: int) -> pygame.font.Font:
+    """Load a system font once per process."""
+    return pygame.font.SysFont(font_name, font_size)
+
+
+class TextCache:
+    """Bounded LRU cache of rendered text surfaces.
+
+    Cached surfaces are shared between `Text` components and must not be drawn
+    on.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(
+            self,
+            text: str,
+            font_name: str,
+            font_size: int,
+            font_color: tuple,
+            font_background: tuple,
+        ) -> pygame.Surface:
+        key = (text, font_name, font_size, tuple(font_color), tuple(font_background))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        font = get_font(font_name, font_size)
+        surface = font.render(text, True, pygame.Color(*font_color), pygame.Color(*font_background))
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+TEXT_CACHE = TextCache()
+
 
 class Component(ABC):
+    """Base class for all components.
+
+    Components are retained: `render` returns a cached surface and only calls
+    `get_surface` again once the component has been invalidated.  Invalidating
+    a component also invalidates its parent, so a change anywhere in the tree
+    marks the path up to the top-level component as dirty.  Components that
+    change on every frame (e.g., animations) set `always_dirty`.
+    """
+
+    always_dirty = False
 
     def __init__(self, width: int, height: int):
         self.width = width
         self.height = height
+        self.parent = None
+        self.dirty = True
+        self.cached_surface = None
 
     @abstractmethod
     def get_surface(self):
         pass
 
+    def adopt(self, children: list):
+        """Make this component the parent of `children`."""
+        for child in children:
+            child.parent = self
+
+    def is_dirty(self):
+        return self.always_dirty or self.dirty or self.cached_surface is None
+
+    def invalidate(self):
+        """Mark this component and all of its ancestors for re-rendering."""
+        self.dirty = True
+        if self.parent is not None:
+            self.parent.invalidate()
+
+    @profiled('component', lambda self: type(self).__name__)
+    def render(self):
+        """Get the surface, re-rendering only if the component is dirty."""
+        if self.is_dirty():
+            self.cached_surface = self.get_surface()
+            self.dirty = False
+        return self.cached_surface
+
 
 class Container(Component):
     """This class is a bordered container for other components.
@@ -35,6 +126,7 @@ class Container(Component):
         self.border_margin = border_margin
         self.child_padding = child_padding
         self.children = children
+        self.adopt(children)
 
         self.surface = pygame.Surface((width, height))
         self.surface.fill(pygame.Color(*background_color))
@@ -49,7 +141,7 @@ class Container(Component):
     def get_surface(self):
         place_x, place_y = self.border_margin + self.child_padding, self.border_margin + self.child_padding
         for child in self.children:
-            self.surface.blit(child.get_surface(), (place_x, place_y))
+            self.surface.blit(child.render(), (place_x, place_y))
             place_x += child.width + self.child_padding
 
         return self.surface
@@ -73,6 +165,7 @@ class VStack(Component):
 
         self.padding = padding
         self.children = children
+        self.adopt(children)
 
         self.surface = pygame.Surface((width, height))
         self.surface.fill(pygame.Color(*background_color))
@@ -80,7 +173,7 @@ class VStack(Component):
     def get_surface(self):
         place_x, place_y = 0, 0
         for child in self.children:
-            self.surface.blit(child.get_surface(), (place_x, place_y))
+            self.surface.blit(child.render(), (place_x, place_y))
             place_y += child.height + self.padding
 
         return self.surface
@@ -98,11 +191,11 @@ class Text(Component):
             font_background: int,
         ):
         self.text = text
-        self.font = pygame.font.SysFont(font_name, font_size)
+        self.font = get_font(font_name, font_size)
         self.font_color = pygame.Color(*font_color)
         self.font_background = pygame.Color(*font_background)
 
-        self.surface = self.font.render(self.text, True, self.font_color, self.font_background)
+        self.surface = TEXT_CACHE.render(text, font_name, font_size, font_color, font_background)
 
         width, height = self.surface.get_size()
         super().__init__(width, height)
@@ -112,19 +205,28 @@ class Text(Component):
 
 
 class LinePlot(Component):
-    """Line plot.  Padding is added all around."""
+    """Line plot.  Padding is added all around.
+
+    The data are reduced to a min/max envelope per pixel column before drawing,
+    so the cost of drawing is bounded by the plot width rather than by the
+    number of points.  NaN values are skipped.
+
+    `y_stats` is an optional precomputed (min, mean, max) of `y_data`, e.g.,
+    the rolling stats of a data source's history, to avoid recomputing them.
+    """
 
     def __init__(
             self,
             width: int,
             height: int,
-            x_data: list[float],
-            y_data: list[float],
+            x_data: list[float] | np.ndarray,
+            y_data: list[float] | np.ndarray,
             bg_color: int,
             fg_color: int,
             x_padding: int,
             y_padding: int,
             x_max: float | None = None,
+            y_stats: tuple[float, float, float] | None = None,
         ):
         super().__init__(width, height)
         self.x_data = x_data
@@ -138,28 +240,41 @@ class LinePlot(Component):
             return
 
         try:
-            self.x0, self.y0 = x_padding, y_padding
-            self.x1, self.y1 = width-x_padding, height-y_padding
-            self.x_max, self.y_max = x_max if x_max is not None else max(x_data), max(y_data)
-            self.x_min, self.y_min = min(x_data), min(y_data)
+            x_data = np.asarray(x_data, dtype=np.float64)
+            y_data = np.asarray(y_data, dtype=np.float64)
+        except (TypeError, ValueError):
+            # Placeholders, e.g., 'NULL' before a data source's first update
+            return
+        valid = ~np.isnan(y_data)
+        x_data, y_data = x_data[valid], y_data[valid]
+        if len(y_data) == 0:
+            return
 
-            y_mean = sum(y_data) / len(y_data)
-            y_mean_scaled = self.__scale_y(y_mean)
+        if y_stats is None:
+            y_stats = y_data.min(), y_data.mean(), y_data.max()
 
-            self.__draw_axes(y_mean_scaled)
-            self.__draw_data(x_data, y_data)
-        except Exception as e:
-            pass
+        self.x0, self.y0 = x_padding, y_padding
+        self.x1, self.y1 = width-x_padding, height-y_padding
+        self.x_max, self.y_max = x_max if x_max is not None else x_data.max(), y_stats[2]
+        self.x_min, self.y_min = x_data.min(), y_stats[0]
 
-    def __scale_x(self, x: float):
+        y_mean = y_stats[1]
+        y_mean_scaled = int(self.__scale_y(y_mean))
+
+        self.__draw_axes(y_mean_scaled)
+        self.__draw_data(x_data, y_data)
+
+    def __scale_x(self, x: float | np.ndarray):
+        x = np.asarray(x, dtype=np.float64)
         if self.x_max == self.x_min:
-            return self.x0
-        return int((x - self.x_min) / (self.x_max - self.x_min) * (self.x1 - self.x0) + self.x0)
+            return np.full_like(x, self.x0, dtype=np.int64)
+        return ((x - self.x_min) / (self.x_max - self.x_min) * (self.x1 - self.x0) + self.x0).astype(np.int64)
 
-    def __scale_y(self, y: float):
+    def __scale_y(self, y: float | np.ndarray):
+        y = np.asarray(y, dtype=np.float64)
         if self.y_max == self.y_min:
-            return self.y0
-        return int(-(y - self.y_min) / (self.y_max - self.y_min) * (self.y1 - self.y0) + self.y1)
+            return np.full_like(y, self.y0, dtype=np.int64)
+        return (-(y - self.y_min) / (self.y_max - self.y_min) * (self.y1 - self.y0) + self.y1).astype(np.int64)
 
     def __draw_axes(self, y_location: float):
         pygame.draw.line(
@@ -177,13 +292,27 @@ class LinePlot(Component):
             1
         )
 
-    def __draw_data(self, x_data: list[float], y_data: list[float]):
-        px0, py0 = self.__scale_x(x_data[0]), self.__scale_y(y_data[0])
-        for xi, yi in zip(x_data[1:], y_data[1:]):
-            px = self.__scale_x(xi)
-            py = self.__scale_y(yi)
-            pygame.draw.line(self.surface, pygame.Color(*self.fg_color), (px0, py0), (px, py), 1)
-            px0, py0 = px, py
+    def __draw_data(self, x_data: np.ndarray, y_data: np.ndarray):
+        px, py = self.__scale_x(x_data), self.__scale_y(y_data)
+
+        # Reduce runs of points in the same pixel column to their min and max
+        if len(px) > 2 * (self.x1 - self.x0) and np.all(px[1:] >= px[:-1]):
+            starts = np.flatnonzero(np.diff(px, prepend=px[0] - 1))
+            columns = px[starts]
+            py_min = np.minimum.reduceat(py, starts)
+            py_max = np.maximum.reduceat(py, starts)
+            px = np.repeat(columns, 2)
+            py = np.column_stack([py_min, py_max]).ravel()
+
+        if len(px) < 2:
+            return
+        pygame.draw.lines(
+            self.surface,
+            pygame.Color(*self.fg_color),
+            False,
+            np.column_stack([px, py]).tolist(),
+            1
+        )
 
     def get_surface(self):
         return self.surface
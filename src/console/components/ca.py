@@ -1,6 +1,12 @@
+import collections
+import functools
+import hashlib
+import queue
 import random
 import math
+import threading
 
+import numpy as np
 import pygame
 
 from src.console.components.base import Component, LinePlot
@@ -21,6 +27,40 @@ def hex_point(ox: float, oy: float, s: float):
     )
 
 
+def get_hex_origins(num_rows: int, num_cols: int, side_length: float, ox: float, oy: float):
+    """Get the `hex_point` origin of every hex, in index order, as a `(num_hexes, 2)` array."""
+    origins = []
+    for i in range(num_rows):
+        row_offset = (i % 2) * math.sqrt(3)*side_length/2
+        # Odd rows have one more hex
+        row_length = num_cols if i % 2 == 0 else num_cols + 1
+        for j in range(row_length):
+            origins.append((ox + j * math.sqrt(3)*side_length - row_offset, oy + i * 3*side_length/2))
+    return np.array(origins)
+
+
+def make_hex_sprite(side_length: float, color: tuple, color_bg: tuple, outline: bool):
+    """Pre-render a hex, outlined or filled, on a transparent background.
+
+    The hex is drawn with its `hex_point` origin at `(0, side_length/2)`, so
+    a sprite is blitted at `(ox, oy - side_length/2)`.  An outlined hex keeps
+    an opaque interior in `color_bg`, so that blitting one over a filled hex
+    clears it.
+    """
+    width = math.ceil(math.sqrt(3)*side_length) + 1
+    height = math.ceil(2*side_length) + 1
+    sprite = pygame.Surface((width, height))
+    # Pixels outside the hex are keyed out
+    key = (255, 0, 255) if tuple(color) != (255, 0, 255) else (0, 255, 0)
+    sprite.fill(key)
+    sprite.set_colorkey(key)
+    points = hex_point(0, side_length/2, side_length)
+    if outline:
+        pygame.draw.polygon(sprite, pygame.Color(*color_bg), points)
+    pygame.draw.polygon(sprite, pygame.Color(*color), points, width=1 if outline else 0)
+    return sprite.convert() if pygame.display.get_surface() is not None else sprite
+
+
 def get_neighbors(num_rows: int, num_cols: int):
     """Get the neighbor array of the grid."""
     num_hexes = num_rows * num_cols + int(num_rows/2)
@@ -113,6 +153,262 @@ def count_hex_states(
 
     return counts
 
+
+class HexTopology:
+    """The neighbors of every hex in compressed sparse row form.
+
+    The neighbors of hex `i` are `indices[offsets[i]:offsets[i + 1]]`, which
+    takes 4 bytes per neighbor instead of a Python list per hex.  The arrays
+    are shared between automata of the same size, so they are read-only.
+    """
+
+    def __init__(self, neighbors: list):
+        self.num_hexes = len(neighbors)
+        self.lengths = np.array([len(hex_neighbors) for hex_neighbors in neighbors], dtype=np.int32)
+        self.offsets = np.zeros(self.num_hexes + 1, dtype=np.int32)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.indices = np.fromiter(
+            (index for hex_neighbors in neighbors for index in hex_neighbors),
+            dtype=np.int32,
+            count=self.offsets[-1]
+        )
+        # Which hex each entry of `indices` belongs to
+        self.rows = np.repeat(np.arange(self.num_hexes, dtype=np.int32), self.lengths)
+        for array in (self.lengths, self.offsets, self.indices, self.rows):
+            array.setflags(write=False)
+
+    def gather(self, hexes: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Get the neighbors of `hexes`, flattened, and the position in `hexes` each belongs to.
+
+        `hexes` of None stands for all hexes in order, which needs no copying.
+        """
+        if hexes is None:
+            return self.rows, self.indices
+        starts = self.offsets[hexes]
+        lengths = self.lengths[hexes]
+        rows = np.repeat(np.arange(len(hexes), dtype=np.int32), lengths)
+        # Entry k of hex r sits at starts[r] + k
+        positions = np.arange(len(rows), dtype=np.int32) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return rows, self.indices[positions]
+
+
+@functools.lru_cache(maxsize=8)
+def get_topology(num_rows: int, num_cols: int) -> HexTopology:
+    """Get the topology of a grid, built once per size."""
+    return HexTopology(get_neighbors(num_rows, num_cols))
+
+
+def make_rule_table(rules: dict, state_values: tuple, include_self: bool = False):
+    """Turn a rules dict into a dense lookup table indexed by the state counts.
+
+    The table holds indices into `state_values`.
+    """
+    max_count = N_NEIGHBORS_MAX + 1 if include_self else N_NEIGHBORS_MAX
+    rule_table = np.zeros((max_count + 1,) * len(state_values), dtype=np.uint8)
+    for counts, new_state in rules.items():
+        rule_table[counts] = state_values.index(new_state)
+    return rule_table
+
+
+def step_active_hexes(
+        hex_states: np.ndarray,
+        topology: 'HexTopology',
+        rule_table: np.ndarray,
+        active: np.ndarray,
+        include_self: bool = False
+    ):
+    """Advance only the `active` hexes one generation, in place.
+
+    Hexes whose neighborhood did not change keep their state, so only those
+    around last generation's changes need evaluating.  Returns the indices of
+    the hexes that changed and their previous states.  `active` is sorted and
+    unique, e.g., from `get_frontier`.
+    """
+    num_states = rule_table.ndim
+
+    # Being sorted and unique, as many hexes as in the grid are all of them
+    rows, neighbors = topology.gather(None if len(active) == topology.num_hexes else active)
+    keys = rows * num_states + hex_states[neighbors]
+    counts = np.bincount(keys, minlength=len(active) * num_states)
+    counts = counts.reshape(len(active), num_states)
+    # Missing neighbors count toward the first state, as in `count_hex_states`
+    counts[:, 0] += N_NEIGHBORS_MAX - topology.lengths[active]
+    if include_self:
+        counts[np.arange(len(active)), hex_states[active]] += 1
+    new_states = rule_table[tuple(counts.T)]
+
+    changed = new_states != hex_states[active]
+    changed_hexes = active[changed]
+    previous_states = hex_states[changed_hexes]
+    hex_states[changed_hexes] = new_states[changed]
+
+    return changed_hexes, previous_states
+
+
+def get_frontier(changed_hexes: np.ndarray, topology: 'HexTopology', include_self: bool = False):
+    """Get the sorted indices of the hexes whose neighborhood contains a changed hex."""
+    # Marking a mask is much cheaper than np.unique over the gathered neighbors
+    frontier = np.zeros(topology.num_hexes, dtype=bool)
+    _, neighbors = topology.gather(changed_hexes)
+    frontier[neighbors] = True
+    if include_self:
+        frontier[changed_hexes] = True
+    return np.flatnonzero(frontier)
+
+
+class CycleDetector:
+    """Detects an automaton returning to a state from the last `history` generations.
+
+    Each generation is identified by a blake2b digest of its uint8 states,
+    so detecting a cycle is a single dict lookup per generation.
+    With `keep_states`, the states themselves are kept too, so that a
+    detected cycle can be replayed.
+    """
+
+    def __init__(self, history: int = 64, keep_states: bool = False):
+        self.history = history
+        self.keep_states = keep_states
+        self.digests = collections.deque()
+        self.states = collections.deque()
+        self.generations = {}
+        self.generation = 0
+
+    def update(self, hex_states: np.ndarray) -> int | None:
+        """Record the next generation and return its period, if it repeats."""
+        digest = hashlib.blake2b(hex_states.data, digest_size=16).digest()
+        self.generation += 1
+
+        period = None
+        if digest in self.generations:
+            period = self.generation - self.generations[digest]
+        self.generations[digest] = self.generation
+
+        self.digests.append(digest)
+        if self.keep_states:
+            self.states.append(hex_states.copy())
+        if len(self.digests) > self.history:
+            digest = self.digests.popleft()
+            if self.generations[digest] == self.generation - self.history:
+                del self.generations[digest]
+            if self.keep_states:
+                self.states.popleft()
+
+        return period
+
+    def cycle(self, period: int) -> list[np.ndarray]:
+        """The states of the last `period` generations, oldest first."""
+        return list(self.states)[-period:]
+
+
+class HexSimulation:
+    """A hexagonal automaton advanced without drawing.
+
+    Only the hexes around the last generation's changes are evaluated, see
+    `step_active_hexes`, and the per-state counts are kept up to date.
+
+    The simulation is settled once it has stopped changing, entered a cycle
+    shorter than `cycle_history` generations, or changed fewer than
+    `quiet_fraction` of its hexes for `quiet_generations` generations in a
+    row.  With `replay`, a detected cycle is replayed from its cached states
+    instead of being simulated.
+    """
+
+    def __init__(
+            self,
+            hex_states: np.ndarray,
+            topology: HexTopology,
+            rule_table: np.ndarray,
+            include_self: bool = False,
+            cycle_history: int = 64,
+            quiet_fraction: float = 0.001,
+            quiet_generations: int = 100,
+            replay: bool = False
+        ):
+        self.topology = topology
+        self.rule_table = rule_table
+        self.include_self = include_self
+
+        num_hexes = len(hex_states)
+        self.hex_states = np.array(hex_states, dtype=np.uint8)
+        self.total_counts = np.bincount(self.hex_states, minlength=rule_table.ndim)
+        # Arbitrary states are not settled, so evaluate every hex at first
+        self.active = np.arange(num_hexes)
+        self.generation = 0
+
+        self.detector = CycleDetector(cycle_history, keep_states=replay)
+        self.period = None
+        self.quiet_threshold = quiet_fraction * num_hexes
+        self.quiet_generations = quiet_generations
+        self.num_quiet = 0
+        self.replay = replay
+        self.cycle = None
+
+    @property
+    def settled(self) -> bool:
+        return self.period is not None or self.num_quiet >= self.quiet_generations
+
+    def step(self, n: int = 1) -> np.ndarray:
+        """Advance `n` generations and return the hexes that changed over them."""
+        changed_hexes = []
+        for _ in range(n):
+            self.generation += 1
+            if self.cycle is not None:
+                changed = self.__replay()
+            # Once nothing changes, nothing ever will
+            elif len(self.active) == 0:
+                self.period = 1
+                continue
+            else:
+                changed = self.__simulate()
+            changed_hexes.append(changed)
+
+        if len(changed_hexes) == 1:
+            return changed_hexes[0]
+        if len(changed_hexes) == 0:
+            return np.empty(0, dtype=np.intp)
+        changed = np.zeros(len(self.hex_states), dtype=bool)
+        for hexes in changed_hexes:
+            changed[hexes] = True
+        return np.flatnonzero(changed)
+
+    def __simulate(self) -> np.ndarray:
+        num_states = self.rule_table.ndim
+        changed, previous_states = step_active_hexes(
+            self.hex_states,
+            self.topology,
+            self.rule_table,
+            self.active,
+            self.include_self
+        )
+        self.active = get_frontier(changed, self.topology, self.include_self)
+        self.total_counts += np.bincount(self.hex_states[changed], minlength=num_states)
+        self.total_counts -= np.bincount(previous_states, minlength=num_states)
+
+        self.num_quiet = self.num_quiet + 1 if len(changed) < self.quiet_threshold else 0
+        self.period = self.detector.update(self.hex_states)
+        if self.replay and self.period is not None and self.period > 1:
+            self.__cache_cycle(self.detector.cycle(self.period))
+
+        return changed
+
+    def __cache_cycle(self, states: list[np.ndarray]):
+        """Keep what changes between the generations of a cycle."""
+        num_states = self.rule_table.ndim
+        self.cycle = []
+        for previous, current in zip(states, states[1:] + states[:1]):
+            changed = np.flatnonzero(current != previous)
+            self.cycle.append((changed, current[changed], np.bincount(current, minlength=num_states)))
+        # The current state is the last of the cycle, so wrap around to the first
+        self.cycle_index = len(self.cycle) - 1
+
+    def __replay(self) -> np.ndarray:
+        changed, new_states, total_counts = self.cycle[self.cycle_index]
+        self.cycle_index = (self.cycle_index + 1) % len(self.cycle)
+        self.hex_states[changed] = new_states
+        self.total_counts[:] = total_counts
+        return changed
+
+
 safe_log = lambda x: math.log(x) if x > 0 else 0
 
 
@@ -171,6 +467,26 @@ RULES = {
 
 
 class HexCA3(Component):
+    """Hexagonal cellular automaton with three states.
+
+    Each call to `get_surface` advances the automaton `generations_per_frame`
+    generations, so the component is always dirty.  With `precompute` > 0,
+    generations are simulated ahead on a background thread into a buffer of
+    that many frames, and a frame for which none is ready shows the previous
+    one rather than waiting.  Neither `step` nor reinitializing waits for the
+    background thread either.  `step` advances without drawing, e.g., to skip
+    the transient.
+
+    Once the automaton settles into stasis or a short cycle, see
+    `HexSimulation`, `on_cycle` decides what happens: 'reinitialize' starts
+    over, 'replay' keeps showing the cycle without simulating it, and
+    'ignore' carries on simulating.
+    """
+
+    always_dirty = True
+    # Redrawing a hex takes eight cropped blits, so past this fraction of
+    # changed hexes a full redraw is cheaper
+    partial_redraw_fraction = 0.04
 
     def __init__(
             self,
@@ -180,7 +496,10 @@ class HexCA3(Component):
             colormap: dict,
             color_bg: int,
             color_fg: int,
-            side_length: float
+            side_length: float,
+            generations_per_frame: int = 1,
+            precompute: int = 0,
+            on_cycle: str = 'reinitialize'
         ):
         self.num_rows = num_rows
         self.num_cols = num_cols
@@ -188,6 +507,10 @@ class HexCA3(Component):
         self.color_bg = color_bg
         self.color_fg = color_fg
         self.side_length = side_length
+        self.generations_per_frame = generations_per_frame
+        self.precompute = precompute
+        self.on_cycle = on_cycle
+        self.worker = None
 
         self.line_plot_height = 50
         height = num_rows * 3 * side_length / 2 + + side_length + self.line_plot_height
@@ -199,82 +522,207 @@ class HexCA3(Component):
         self.state_values = (0, 1, 2)
         self.rules, self.neighbors_include_self = RULES[rules](self.state_values)
         self.num_hexes = num_rows * num_cols + int(num_rows/2)
-        self.neighbors = get_neighbors(num_rows, num_cols)
+        self.topology = get_topology(num_rows, num_cols)
+
+        # Hexes never move, so draw them by blitting one sprite per state
+        origins = get_hex_origins(num_rows, num_cols, side_length, self.ox, self.oy)
+        self.sprite_positions = [
+            (round(x), round(y - side_length/2)) for x, y in origins.tolist()
+        ]
+        self.sprite_origins = np.array(self.sprite_positions).reshape(-1, 2)
+        self.sprites = [
+            make_hex_sprite(side_length, colormap[state], color_bg, outline=state == self.state_values[0])
+            for state in self.state_values
+        ]
+        self.sprite_size = self.sprites[0].get_size()
+        self.sprite_bg = pygame.Surface(self.sprite_size)
+        self.sprite_bg.fill(pygame.Color(*color_bg))
         self.__initialize()
 
     def __initialize(self, rules: str = 'spiral'):
+        self.__stop_precompute()
         self.rules, self.neighbors_include_self = RULES[rules](self.state_values)
-        self.hex_states = [
-            random.choices(self.state_values, weights=(10, 1, 1), k=1)[0]
-            for _ in range(self.num_hexes)
-        ]
+        self.rule_table = make_rule_table(self.rules, self.state_values, self.neighbors_include_self)
+        self.simulation = HexSimulation(
+            random.choices(range(len(self.state_values)), weights=(10, 1, 1), k=self.num_hexes),
+            self.topology,
+            self.rule_table,
+            self.neighbors_include_self,
+            replay=self.on_cycle == 'replay'
+        )
+        self.__show_simulation()
         self.entropy_history = []
 
     def reinitialize(self):
         self.__initialize()
 
-    def __draw_hexes(self):
-        index = -1
-        for i in range(self.num_rows):
-            short_row = i % 2 == 0
-            row_offset = (i % 2) * math.sqrt(3)*self.side_length/2
-            for j in range(self.num_cols):
-                x = self.ox + j * math.sqrt(3)*self.side_length - row_offset
-                y = self.oy + i * 3*self.side_length/2
-                hex_points = hex_point(x, y, self.side_length)
-                index += 1
-                fill = self.hex_states[index]
-                width = 1 if fill == self.state_values[0] else 0
-                pygame.draw.polygon(
-                    self.surface,
-                    pygame.Color(*self.colormap[self.hex_states[index]]),
-                    hex_points,
-                    width=width
-                )
-
-            # Odd rows have one more hex
-            # This will never be the first row, it may be the last row
-            if not short_row:
-                x = self.ox + self.num_cols * math.sqrt(3)*self.side_length - row_offset
-                y = self.oy + i * 3*self.side_length/2
-                hex_points = hex_point(x, y, self.side_length)
-                index += 1
-                fill = self.hex_states[index]
-                width = 1 if fill == self.state_values[0] else 0
-                pygame.draw.polygon(
-                    self.surface,
-                    pygame.Color(*self.colormap[self.hex_states[index]]),
-                    hex_points,
-                    width=width
-                )
+    def __show_simulation(self):
+        """Display the current state of the simulation, in full."""
+        if self.precompute > 0:
+            # The simulation belongs to the worker thread once it runs
+            self.hex_states = self.simulation.hex_states.copy()
+            self.total_counts = self.simulation.total_counts.copy()
+        else:
+            self.hex_states = self.simulation.hex_states
+            self.total_counts = self.simulation.total_counts
+        self.settled = self.simulation.settled
+        self.redraw = True
+
+    def step(self, n: int = 1):
+        """Advance `n` generations without drawing them.
+
+        While simulating ahead, the worker is asked to skip them, and the
+        frames until it has are those already shown.
+        """
+        if self.worker is None:
+            self.simulation.step(n)
+            self.__show_simulation()
+        else:
+            self.skips.put(n)
+            self.num_skips += 1
+
+    def close(self):
+        """Stop simulating ahead, e.g., before exiting."""
+        self.__stop_precompute(wait=True)
+
+    def __start_precompute(self):
+        self.buffer = queue.Queue(maxsize=self.precompute)
+        self.skips = queue.SimpleQueue()
+        self.num_skips = 0
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(
+            target=self.__precompute,
+            args=(self.simulation, self.buffer, self.skips, self.stopped),
+            daemon=True
+        )
+        self.worker.start()
+
+    def __stop_precompute(self, wait: bool = False):
+        """Stop the worker, by default without waiting for its generation.
+
+        The worker has a simulation of its own, which is not looked at again.
+        """
+        if self.worker is not None:
+            self.stopped.set()
+            if wait:
+                self.worker.join()
+            self.worker = None
+
+    def __precompute(
+            self,
+            simulation: HexSimulation,
+            buffer: queue.Queue,
+            skips: queue.SimpleQueue,
+            stopped: threading.Event
+        ):
+        num_skips = 0
+        while not stopped.is_set():
+            generations = self.generations_per_frame
+            while not skips.empty():
+                generations += skips.get()
+                num_skips += 1
+            simulation.step(generations)
+            # Frames are tagged with the skips they include, so that those
+            # from before a skip can be told apart
+            frame = (num_skips, simulation.hex_states.copy(), simulation.total_counts.copy(), simulation.settled)
+            while not stopped.is_set():
+                try:
+                    buffer.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def __next_frame(self) -> np.ndarray | None:
+        """Advance to the next frame and return the hexes that changed.
+
+        Returns None if no precomputed frame is ready.
+        """
+        if self.precompute == 0:
+            changed = self.simulation.step(self.generations_per_frame)
+            self.settled = self.simulation.settled
+            return changed
+
+        if self.worker is None:
+            self.__start_precompute()
+        try:
+            num_skips, hex_states, total_counts, settled = self.buffer.get_nowait()
+            while num_skips < self.num_skips:
+                num_skips, hex_states, total_counts, settled = self.buffer.get_nowait()
+        except queue.Empty:
+            return None
+        changed = np.flatnonzero(hex_states != self.hex_states)
+        self.hex_states, self.total_counts, self.settled = hex_states, total_counts, settled
+        return changed
+
+    def __draw_hexes(self, hexes: np.ndarray):
+        sprites, positions = self.sprites, self.sprite_positions
+        self.surface.blits(
+            [
+                (sprites[state], positions[index])
+                for index, state in zip(hexes.tolist(), self.hex_states[hexes].tolist())
+            ],
+            doreturn=False
+        )
+
+    def __redraw_hexes(self, hexes: np.ndarray):
+        """Redraw `hexes` over an up-to-date surface.
+
+        Sprites overlap at shared edges, and the outline of a hex does not
+        quite cover the same pixels as its fill.  So the sprite area of each
+        hex is cleared and redrawn from the hex and its neighbors, in index
+        order as in a full redraw.
+        """
+        rows, neighbors = self.topology.gather(hexes)
+        # Index -1 stands for the background, which goes first
+        rows = np.concatenate([np.arange(len(hexes)), np.arange(len(hexes)), rows])
+        members = np.concatenate([np.full(len(hexes), -1), hexes, neighbors])
+        order = np.lexsort((members, rows))
+        rows, members = rows[order], members[order]
+
+        # Crop every sprite to the area of the hex it is redrawn for
+        clip = self.sprite_origins[hexes[rows]]
+        origins = np.where(members[:, None] >= 0, self.sprite_origins[members], clip)
+        corners = np.maximum(clip, origins)
+        sizes = np.minimum(clip, origins) + self.sprite_size - corners
+        areas = np.column_stack([corners - origins, sizes])
+        states = np.where(members >= 0, self.hex_states[members], len(self.sprites))
+
+        sprites = self.sprites + [self.sprite_bg]
+        self.surface.blits(
+            [
+                (sprites[state], corner, area)
+                for state, corner, area in zip(states.tolist(), corners.tolist(), areas.tolist())
+            ],
+            doreturn=False
+        )
 
     def get_surface(self):
         # update hexes
-        new_hex_states = self.hex_states.copy()
-        for i in range(self.num_hexes):
-            counts = count_hex_states(
-                i, self.hex_states,
-                self.neighbors,
-                self.state_values,
-                self.neighbors_include_self
-            )
-            new_hex_states[i] = self.rules[tuple(counts[state] for state in self.state_values)]
-
-        self.hex_states = new_hex_states
-        total_counts = {state: 0 for state in self.state_values}
-        for i in range(self.num_hexes):
-            total_counts[self.hex_states[i]] += 1
-        entropy = -sum([
-            total_counts[state] * safe_log(total_counts[state] / self.num_hexes)
-            for state in self.state_values
-        ])
-        self.entropy_history.append(entropy)
-        if len(self.entropy_history) > 50:
-            self.entropy_history = self.entropy_history[-50:]
-
-        # draw everything
-        self.surface.fill(pygame.Color(*self.color_bg))
-        self.__draw_hexes()
+        changed = self.__next_frame()
+        if changed is not None:
+            entropy = -sum([
+                count * safe_log(count / self.num_hexes)
+                for count in self.total_counts
+            ])
+            self.entropy_history.append(entropy)
+            if len(self.entropy_history) > 50:
+                self.entropy_history = self.entropy_history[-50:]
+        elif not self.redraw:
+            return self.surface
+
+        # draw the hexes that changed, or all of them after initializing or
+        # when too many changed
+        if self.redraw or len(changed) > self.partial_redraw_fraction * self.num_hexes:
+            self.surface.fill(pygame.Color(*self.color_bg))
+            self.__draw_hexes(np.arange(self.num_hexes))
+            self.redraw = False
+        else:
+            self.__redraw_hexes(changed)
+
+        self.surface.fill(
+            pygame.Color(*self.color_bg),
+            (0, self.height - self.line_plot_height, self.width, self.line_plot_height)
+        )
         if len(self.entropy_history) > 2:
             plot = LinePlot(
                 self.width - self.ox,
@@ -287,8 +735,8 @@ class HexCA3(Component):
             )
             self.surface.blit(plot.get_surface(), (self.ox, self.height - self.line_plot_height))
 
-        # re-initialize if all states are the same
-        if any([count==self.num_hexes for count in total_counts.values()]):
+        # re-initialize if all states are the same, or if nothing much happens any more
+        if any(self.total_counts == self.num_hexes) or (self.settled and self.on_cycle == 'reinitialize'):
             self.__initialize()
 
-        return self.surface
\ No newline at end of file
+        return self.surface
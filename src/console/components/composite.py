@@ -1,6 +1,9 @@
 from typing import Any
 
+import numpy as np
+
 from console.components.base import Component, Container, Text, VStack, LinePlot
+from console.profiler import Profiler
 
 
 class TextInBorder(Component):
@@ -23,20 +26,27 @@ class TextInBorder(Component):
         width, height = vstack.width + pad_amount, vstack.height + pad_amount
         self.component = Container(width, height, [vstack], **container_params)
         super().__init__(self.component.width, self.component.height)
+        self.adopt([self.component])
 
     def get_surface(self):
-        return self.component.get_surface()
+        return self.component.render()
 
 
 class AnnotatedLinePlots(Component):
+    """Labeled line plots annotated with the min/mean/max of each series.
+
+    `y_stats` optionally gives a precomputed (min, mean, max) per series;
+    otherwise they are computed from the data.
+    """
 
     def __init__(
             self,
             labels: list[str],
-            x_data: list[float],
-            y_datas: list[list[float]],
+            x_data: list[float] | np.ndarray,
+            y_datas: list[list[float] | np.ndarray],
             text_params: dict[str, Any],
-            container_params: dict[str, Any]
+            container_params: dict[str, Any],
+            y_stats: list[tuple[float, float, float]] | None = None,
         ):
 
         plots = []
@@ -50,12 +60,21 @@ class AnnotatedLinePlots(Component):
         }
         small_text_params = {key: value for key, value in text_params.items()}
         small_text_params['font_size'] = text_params['font_size']//2
-        for label, y_data in zip(labels, y_datas):
+        if y_stats is None:
+            y_stats = [None] * len(y_datas)
+        for label, y_data, stats in zip(labels, y_datas, y_stats):
             label_comp = Text(label, **text_params)
 
             try:
-                annotations = [min(y_data), sum(y_data)/len(y_data), max(y_data)]
+                if stats is None:
+                    y_array = np.asarray(y_data, dtype=np.float64)
+                    y_array = y_array[~np.isnan(y_array)]
+                    stats = (y_array.min(), y_array.mean(), y_array.max())
+                if np.isnan(stats).any():
+                    raise ValueError('no data')
+                annotations = list(stats)
             except:
+                stats = None
                 annotations = [0, 0, 0]
             # values = VStack(
             #     [Text(f'{y:.2f}', **text_params) for y in annotations],
@@ -77,7 +96,8 @@ class AnnotatedLinePlots(Component):
                 container_params['background_color'],
                 container_params['border_color'],
                 x_padding = 5,
-                y_padding = 2
+                y_padding = 2,
+                y_stats = stats
             )
 
             # height += 2*container_params['child_padding']
@@ -97,8 +117,41 @@ class AnnotatedLinePlots(Component):
         width = self.plots_component.width + 2*container_params['border_margin'] + 2*container_params['child_padding']
         self.component = Container(width, height, [self.plots_component], **container_params)
         super().__init__(width, height)
+        self.adopt([self.component])
 
     def get_surface(self):
-        return self.component.get_surface()
+        return self.component.render()
+
+
+class ProfilerOverlay(Component):
+    """Table of profiler timings in milliseconds, slowest first.
+
+    Times are inclusive, e.g., a container's time includes its children.
+    """
+
+    def __init__(
+            self,
+            profiler: Profiler,
+            text_params: dict[str, Any],
+            container_params: dict[str, Any],
+            max_rows: int = 20,
+        ):
+        rows = sorted(
+            (
+                (f'{category}/{name}', histogram)
+                for (category, name), histogram in profiler.histograms.items()
+            ),
+            key=lambda row: row[1].mean,
+            reverse=True
+        )[:max_rows]
+        lines = [f'{"NAME":<28}{"MEAN":>8}{"P95":>8}{"MAX":>8}'] + [
+            f'{name[:28]:<28}{histogram.mean*1e3:8.2f}{histogram.percentile(95)*1e3:8.2f}{histogram.max*1e3:8.2f}'
+            for name, histogram in rows
+        ]
 
+        self.component = TextInBorder(lines, text_params, container_params)
+        super().__init__(self.component.width, self.component.height)
+        self.adopt([self.component])
 
+    def get_surface(self):
+        return self.component.render()
@@ -0,0 +1,101 @@
+from typing import Any, Callable, Hashable
+
+import pygame
+
+from console.components.base import Component
+
+
+class Placement:
+    """A component placed on the screen, with the inputs it was built from."""
+
+    def __init__(self, component: Component, position: tuple[int, int], inputs: Hashable):
+        self.component = component
+        self.position = position
+        self.inputs = inputs
+        self.rect = None
+
+
+class Compositor:
+    """Retained-mode compositor for the top-level components on a screen.
+
+    Each frame, components are placed by name along with the inputs they are
+    built from.  A component is only rebuilt when its inputs change, and `draw`
+    only re-blits components that are dirty, returning the changed screen
+    rects to pass to `pygame.display.update`.
+    """
+
+    def __init__(self, screen: pygame.Surface, background_color: Any):
+        self.screen = screen
+        self.background_color = pygame.Color(*background_color)
+        self.placements: dict[str, Placement] = {}
+        self.erased_rects = []
+
+        self.screen.fill(self.background_color)
+
+    def place(
+            self,
+            name: str,
+            position: tuple[int, int] | Callable[[Component], tuple[int, int]],
+            inputs: Hashable,
+            build: Callable[[], Component],
+        ) -> Component:
+        """Place a component, calling `build` only if `inputs` changed.
+
+        `inputs` should be cheap to compare, e.g., a data source's last update
+        time rather than the data itself.  `build` may return the same
+        component instance, in which case it is simply invalidated.  If the
+        position depends on the component's size, pass a function of the
+        component instead.
+        """
+        placement = self.placements.get(name)
+        if placement is None:
+            placement = Placement(build(), None, inputs)
+            self.placements[name] = placement
+        elif placement.inputs != inputs:
+            placement.component = build()
+            placement.component.invalidate()
+            placement.inputs = inputs
+
+        if callable(position):
+            position = position(placement.component)
+        if placement.position != position:
+            placement.position = position
+            placement.component.invalidate()
+
+        return placement.component
+
+    def remove(self, name: str):
+        placement = self.placements.pop(name, None)
+        if placement is not None and placement.rect is not None:
+            self.erased_rects.append(placement.rect)
+
+    def draw(self) -> list[pygame.Rect]:
+        """Re-blit dirty components and return the screen rects that changed."""
+        changed_rects = []
+
+        # Clear wherever a component no longer is, i.e., it moved or shrank
+        redraw = set()
+        for placement in self.placements.values():
+            component = placement.component
+            if not component.is_dirty() or placement.rect is None:
+                continue
+            new_rect = pygame.Rect(placement.position, (component.width, component.height))
+            if not new_rect.contains(placement.rect):
+                self.erased_rects.append(placement.rect)
+        for rect in self.erased_rects:
+            self.screen.fill(self.background_color, rect)
+            changed_rects.append(rect)
+            redraw.update(
+                name for name, placement in self.placements.items()
+                if placement.rect is not None and placement.rect.colliderect(rect)
+            )
+        self.erased_rects = []
+
+        for name, placement in self.placements.items():
+            component = placement.component
+            if not component.is_dirty() and name not in redraw:
+                continue
+            placement.rect = self.screen.blit(component.render(), placement.position)
+            changed_rects.append(placement.rect)
+
+        return changed_rects
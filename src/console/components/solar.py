@@ -1,4 +1,5 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import functools
 import zoneinfo as zi
 
 import pygame
@@ -24,7 +25,33 @@ def hour_float_to_datetime(year: int, month: int, day: int, hour: float) -> date
     return datetime(year, month, day, hour_int, minute_int, tzinfo=TIMEZONE)
 
 
-def get_soloar_parameters(time: datetime) -> tuple:
+def to_epoch_seconds(times) -> np.ndarray:
+    """Convert a datetime, sequence of datetimes or datetime64/epoch array to epoch seconds."""
+    if isinstance(times, datetime):
+        return np.array([times.timestamp()])
+    times = np.asarray(times)
+    if times.dtype == object:
+        return np.array([t.timestamp() for t in times.ravel()]).reshape(times.shape)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+    return times.astype(np.float64)
+
+
+def get_utc_offsets(epoch_seconds: np.ndarray) -> np.ndarray:
+    """UTC offsets (seconds) of TIMEZONE at each time.
+
+    Offsets only change on the hour, so the time zone is only consulted once
+    per distinct hour rather than once per time.
+    """
+    hours, inverse = np.unique(epoch_seconds // 3600, return_inverse=True)
+    offsets = np.array([
+        datetime.fromtimestamp(hour * 3600, TIMEZONE).utcoffset().total_seconds()
+        for hour in hours
+    ])
+    return offsets[inverse].reshape(epoch_seconds.shape)
+
+
+def get_soloar_parameters(time) -> tuple:
     """Get solar parameters for a given time.
 
     The solar parameters are:
@@ -36,9 +63,23 @@ def get_soloar_parameters(time: datetime) -> tuple:
     - Azimuth angle (degrees)
     - Sunrise (datetime)
     - Sunset (datetime)
+
+    `time` may also be an array of datetimes, datetime64 values or epoch
+    seconds, in which case every parameter is an array and sunrise and sunset
+    are given in epoch seconds.
     """
-    utc_offset = time.utcoffset().total_seconds() / 3600
-    days_since_boy = (time - datetime(time.year, 1, 1, tzinfo=TIMEZONE)).days
+    scalar = isinstance(time, datetime)
+    epoch_seconds = to_epoch_seconds(time)
+    utc_offset_sec = get_utc_offsets(epoch_seconds)
+    utc_offset = utc_offset_sec / 3600
+
+    # Local calendar fields
+    local_time = (epoch_seconds + utc_offset_sec).astype(np.int64).astype('datetime64[s]')
+    local_day = local_time.astype('datetime64[D]')
+    days_since_boy = (local_day - local_time.astype('datetime64[Y]').astype('datetime64[D]')).astype(np.int64)
+    seconds_since_midnight = (local_time - local_day).astype(np.int64)
+    hour = seconds_since_midnight // 3600
+    minute = seconds_since_midnight % 3600 // 60
 
     # Ref: https://www.pveducation.org/pvcdrom/properties-of-sunlight/solar-time
     # zenith angle is the angle between the sun and the vertical direction
@@ -48,7 +89,7 @@ def get_soloar_parameters(time: datetime) -> tuple:
     B = np.deg2rad(360/365 * (days_since_boy - 81))
     eq_of_time = 9.87*np.sin(2*B) - 7.53*np.cos(B) - 1.5*np.sin(B)
     time_correction_factor = 4*(LONG - locat_std_time_meridian) + eq_of_time
-    local_solar_time_hrs = time.hour + (time.minute + time_correction_factor) / 60
+    local_solar_time_hrs = hour + (minute + time_correction_factor) / 60
     hour_angle = 15*(local_solar_time_hrs - 12)
     declination_deg = -23.45*np.cos(np.deg2rad(360/365*(days_since_boy+10)))
 
@@ -60,16 +101,25 @@ def get_soloar_parameters(time: datetime) -> tuple:
     zenith_angle_deg = np.rad2deg(np.arccos(cos_zenith_angle))
     altitude_angle_deg = 90 - zenith_angle_deg
     azimuth_angle_deg = np.rad2deg(np.arccos((np.sin(declination_rad)*np.cos(lat_rad) - np.cos(declination_rad)*np.sin(lat_rad)*np.cos(hra_rad)) / np.cos(np.deg2rad(altitude_angle_deg))))
-    azimuth_angle_deg = 360 - azimuth_angle_deg if hour_angle > 0 else azimuth_angle_deg
-
-    sunrise = hour_float_to_datetime(
-        time.year, time.month, time.day,
-        12 - 1/15*np.rad2deg(np.arccos(-np.tan(lat_rad)*np.tan(declination_rad))) - time_correction_factor/60
-    )
-    sunset = hour_float_to_datetime(
-        time.year, time.month, time.day,
-        12 + 1/15*np.rad2deg(np.arccos(-np.tan(lat_rad)*np.tan(declination_rad))) - time_correction_factor/60
-    )
+    azimuth_angle_deg = np.where(hour_angle > 0, 360 - azimuth_angle_deg, azimuth_angle_deg)
+
+    # Sunrise and sunset, truncated to the minute like `hour_float_to_datetime`
+    half_day_hrs = 1/15*np.rad2deg(np.arccos(-np.tan(lat_rad)*np.tan(declination_rad)))
+    local_midnight = local_day.astype(np.int64) * 24*60*60 - utc_offset_sec
+    sunrise = local_midnight + np.floor((12 - half_day_hrs - time_correction_factor/60) * 60) * 60
+    sunset = local_midnight + np.floor((12 + half_day_hrs - time_correction_factor/60) * 60) * 60
+
+    if scalar:
+        return (
+            local_solar_time_hrs[0],
+            hour_angle[0],
+            declination_deg[0],
+            zenith_angle_deg[0],
+            altitude_angle_deg[0],
+            azimuth_angle_deg[0],
+            datetime.fromtimestamp(sunrise[0], TIMEZONE),
+            datetime.fromtimestamp(sunset[0], TIMEZONE),
+        )
 
     return (
         local_solar_time_hrs,
@@ -101,16 +151,50 @@ def get_sun_path(today: datetime) -> list:
     day_length = sunset - sunrise
     day_length_hrs = day_length.total_seconds() / 3600
     time_range = [sunrise + timedelta(hours=i) for i in np.linspace(0, day_length_hrs, 24)]
-    solar_params_today = []
-    for ti in time_range:
+    (
+        _, _, _, _,
+        altitude_angles_deg,
+        azimuth_angles_deg, _, _
+    ) = get_soloar_parameters(time_range)
+
+    return list(zip(time_range, altitude_angles_deg, azimuth_angles_deg))
+
+
+class Ephemeris:
+    """The sun's position over one day at minute resolution."""
+
+    def __init__(self, day: date):
+        midnight = datetime(day.year, day.month, day.day, tzinfo=TIMEZONE)
+        next_midnight = midnight + timedelta(days=1)
+        self.times = np.arange(midnight.timestamp(), next_midnight.timestamp() + 60, 60)
+
         (
             _, _, _, _,
-            altitude_angle_deg,
-            azimuth_angle_deg, _, _
-        ) = get_soloar_parameters(ti)
-        solar_params_today.append((ti, altitude_angle_deg, azimuth_angle_deg))
+            self.altitude_angles_deg,
+            azimuth_angles_deg,
+            sunrise,
+            sunset,
+        ) = get_soloar_parameters(self.times)
+        # Unwrap so that interpolating across north does not sweep through south
+        self.azimuth_angles_deg = np.rad2deg(np.unwrap(np.deg2rad(azimuth_angles_deg)))
+
+        noon_index = len(self.times) // 2
+        self.sunrise = datetime.fromtimestamp(sunrise[noon_index], TIMEZONE)
+        self.sunset = datetime.fromtimestamp(sunset[noon_index], TIMEZONE)
+        self.sun_path = get_sun_path(midnight)
+
+    def position(self, time: datetime) -> tuple[float, float]:
+        """Altitude and azimuth angles (degrees) at `time`."""
+        t = time.timestamp()
+        altitude = np.interp(t, self.times, self.altitude_angles_deg)
+        azimuth = np.interp(t, self.times, self.azimuth_angles_deg) % 360
+        return altitude, azimuth
+
 
-    return solar_params_today
+@functools.lru_cache(maxsize=8)
+def get_ephemeris(day: date) -> Ephemeris:
+    """Get the (cached) ephemeris for a day."""
+    return Ephemeris(day)
 
 
 class SunPath(Component):
@@ -268,10 +352,10 @@ class SunPath(Component):
     def get_surface(self):
         """Draw the sun path plot for today with the current position."""
         now = datetime.now(TIMEZONE)
-        solar_params_current = get_soloar_parameters(now)
-        sunrise, sunset = solar_params_current[6], solar_params_current[7]
-        altitude_angle_current, azimuth_angle_current = solar_params_current[4], solar_params_current[5]
-        solar_params_today = get_sun_path(now)
+        ephemeris = get_ephemeris(now.date())
+        sunrise, sunset = ephemeris.sunrise, ephemeris.sunset
+        altitude_angle_current, azimuth_angle_current = ephemeris.position(now)
+        solar_params_today = ephemeris.sun_path
 
         self.surface.blit(self.base_plot, (0, 0))
 
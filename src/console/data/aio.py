@@ -0,0 +1,150 @@
+"""Asyncio backend for data sources.
+
+Request functions are coroutines that take a shared `httpx.AsyncClient`, so
+every source reuses the same pool of keep-alive connections.  Each source is
+polled by its own timer on an event loop running in a background thread, and
+the pygame loop only ever picks up finished results.
+"""
+from typing import Awaitable, Callable
+import asyncio
+import logging
+import threading
+
+import httpx
+
+from console.data.retry import CircuitBreaker
+from console.data.source import DataSource
+from console.profiler import profiled
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDataRetriever:
+
+    def __init__(self, max_connections: int = 20, timeout: float = 10.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.timeout = timeout
+
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self.tasks = {}
+        self.pending = {}
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def __start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        async def make_client():
+            return httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        self.client = asyncio.run_coroutine_threadsafe(make_client(), self.loop).result()
+
+    def schedule(
+            self,
+            name: str,
+            request_func: Callable[[httpx.AsyncClient], Awaitable[dict]],
+            refresh_frequency: float,
+            breaker: CircuitBreaker | None = None,
+            on_change: Callable[[], None] | None = None,
+        ):
+        """Poll `request_func` every `refresh_frequency` seconds.
+
+        Failures are retried, or the polling paused, according to `breaker`.
+        `on_change` is called from the loop thread when a request starts or
+        finishes.
+        """
+        if self.loop is None:
+            self.__start()
+        self.tasks[name] = asyncio.run_coroutine_threadsafe(
+            self.__poll(name, request_func, refresh_frequency, breaker or CircuitBreaker(), on_change),
+            self.loop
+        )
+
+    async def __poll(
+            self,
+            name: str,
+            request_func: Callable,
+            refresh_frequency: float,
+            breaker: CircuitBreaker,
+            on_change: Callable[[], None] | None,
+        ):
+        on_change = on_change or (lambda: None)
+        while True:
+            started = self.loop.time()
+            breaker.allow()
+            self.pending[name] = True
+            on_change()
+            try:
+                result = await request_func(self.client)
+            except Exception as e:
+                logger.warning('%s: request failed: %r', name, e)
+                result = {}
+            with self.lock:
+                self.results[name] = result
+            self.pending[name] = False
+            on_change()
+
+            if len(result) > 0:
+                if breaker.failures > 0:
+                    logger.info('%s: recovered after %d failures', name, breaker.failures)
+                breaker.record_success()
+                delay = refresh_frequency - (self.loop.time() - started)
+            else:
+                delay = breaker.record_failure()
+                logger.warning(
+                    '%s: failure %d, circuit %s, next attempt in %.1f s',
+                    name, breaker.failures, breaker.state, delay
+                )
+            await asyncio.sleep(max(0, delay))
+
+    def is_pending(self, name: str):
+        return self.pending.get(name, False)
+
+    def get_result(self, name: str):
+        """Pop the latest result, or None if there is nothing new."""
+        with self.lock:
+            return self.results.pop(name, None)
+
+    def shutdown(self):
+        if self.loop is None:
+            return
+        for task in self.tasks.values():
+            task.cancel()
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+
+ASYNC_POOL = AsyncDataRetriever()
+
+
+class AsyncDataSource(DataSource):
+    """A data source polled by a timer on `ASYNC_POOL`.
+
+    `request_func` is a coroutine function taking the shared
+    `httpx.AsyncClient`.  `update` never blocks; it only collects results.
+    Retries are driven by the poll loop, which owns the circuit breaker.
+    """
+
+    @profiled('source', lambda self: self.name)
+    def update(self, now_ns: int | None = None):
+        if self.name not in ASYNC_POOL.tasks:
+            ASYNC_POOL.schedule(self.name, self.request_func, self.refresh_frequency, self.breaker, self.notify)
+            # From here on the poll loop keeps time, and wakes the scheduler
+            self.next_due_ns = None
+
+        self.pending = ASYNC_POOL.is_pending(self.name)
+
+        response = ASYNC_POOL.get_result(self.name)
+        if response is not None and len(response) > 0:
+            self.store(response)
+
+        return self.data
@@ -0,0 +1,90 @@
+"""On-disk cache of raw HTTP response payloads."""
+import hashlib
+import json
+import os
+import time
+
+
+# Overrides the user cache directory, e.g., from .env
+CACHE_DIR_VARIABLE = 'CONSOLE_CACHE_DIR'
+
+
+def cache_dir(*names: str) -> str:
+    """Path under the cache directory, by default `~/.cache/console`.
+
+    Read from the environment on each call, so that worker processes, which
+    inherit it, agree with the main process.
+    """
+    root = os.environ.get(CACHE_DIR_VARIABLE)
+    if not root:
+        user_cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        root = os.path.join(user_cache, 'console')
+    return os.path.join(root, *names)
+
+
+class ResponseCache:
+    """Raw response payloads keyed by request, stored one file per request.
+
+    Entries younger than `ttl` seconds are served without a request.  Older
+    entries are kept as a fallback for when the API is unavailable, and their
+    ETag, if any, is used to make conditional requests.
+
+    Entries are stored in `cache_dir(name)`.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+
+    @property
+    def directory(self) -> str:
+        return cache_dir(self.name)
+
+    def key(self, url: str, params: dict) -> str:
+        request = json.dumps([url, params], sort_keys=True, default=str)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def __path(self, key: str, suffix: str = '.bin') -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def age(self, key: str) -> float | None:
+        try:
+            return time.time() - os.path.getmtime(self.__path(key))
+        except OSError:
+            return None
+
+    def load(self, key: str, max_age: float | None = None) -> bytes | None:
+        """The cached payload, or None if missing or older than `max_age`."""
+        age = self.age(key)
+        if age is None or (max_age is not None and age > max_age):
+            return None
+        try:
+            with open(self.__path(key), 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def conditional_headers(self, key: str) -> dict[str, str]:
+        try:
+            with open(self.__path(key, '.etag')) as file:
+                return {'If-None-Match': file.read()}
+        except OSError:
+            return {}
+
+    def store(self, key: str, content: bytes, etag: str | None = None):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.__path(key, '.tmp')
+        with open(temp_path, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, self.__path(key))
+
+        if etag is not None:
+            with open(self.__path(key, '.etag'), 'w') as file:
+                file.write(etag)
+
+    def touch(self, key: str):
+        """Mark an entry as fresh, e.g., after a 304 Not Modified."""
+        try:
+            os.utime(self.__path(key))
+        except OSError:
+            pass
@@ -0,0 +1,203 @@
+from collections import deque
+import datetime as dt
+import math
+from numbers import Real
+
+import numpy as np
+
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.UTC)
+
+
+class RollingStats:
+    """Min, mean and max over a sliding window, updated in O(1) per value.
+
+    Values are pushed and evicted with increasing sequence numbers.  The min
+    and max are kept in monotonic deques and the mean from a running sum.
+    NaN values are ignored.
+    """
+
+    def __init__(self):
+        self.mins = deque()
+        self.maxs = deque()
+        self.total = 0.0
+        self.count = 0
+
+    def push(self, seq: int, value: float):
+        if math.isnan(value):
+            return
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((seq, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((seq, value))
+        self.total += value
+        self.count += 1
+
+    def evict(self, seq: int, value: float):
+        """Remove the value that was pushed with sequence number `seq`."""
+        if math.isnan(value):
+            return
+        if self.mins and self.mins[0][0] == seq:
+            self.mins.popleft()
+        if self.maxs and self.maxs[0][0] == seq:
+            self.maxs.popleft()
+        self.count -= 1
+        # Reset to avoid accumulating round-off once the window is empty
+        self.total = self.total - value if self.count > 0 else 0.0
+
+    def get(self) -> tuple[float, float, float]:
+        """(min, mean, max) of the window, NaN if it is empty."""
+        if self.count == 0:
+            return math.nan, math.nan, math.nan
+        return self.mins[0][1], self.total / self.count, self.maxs[0][1]
+
+
+class RingBuffer:
+    """Fixed-capacity columnar history of numeric records.
+
+    Each field is stored in its own typed column alongside an int64 column of
+    UTC timestamps (nanoseconds since the epoch).  Every column is allocated at
+    twice the capacity and each value is written twice, `capacity` slots apart,
+    so the most recent `len(self)` entries are always one contiguous slice.
+    Appends are O(1) and reads are zero-copy views in chronological order.
+
+    If `fields` is not given, the numeric fields of the first appended record
+    are used.  Values that are missing or not numeric are stored as NaN.
+
+    Rolling min/mean/max of every field over the buffer are kept up to date
+    on each append and are available from `stats`.
+    """
+
+    def __init__(self, capacity: int, fields: dict[str, np.dtype] | list[str] | None = None):
+        self.capacity = capacity
+        self.fields = None
+        self.columns = {}
+        self.rolling_stats = {}
+        self.timestamps_ns = np.zeros(2*capacity, dtype=np.int64)
+        self.head = 0
+        self.size = 0
+        # Total number of records ever appended, used as their sequence number
+        self.appended = 0
+
+        if fields is not None:
+            self.__allocate(fields)
+
+    def __allocate(self, fields: dict[str, np.dtype] | list[str]):
+        if not isinstance(fields, dict):
+            fields = {field: np.float64 for field in fields}
+        self.fields = list(fields)
+        self.columns = {
+            field: np.full(2*self.capacity, np.nan if np.issubdtype(dtype, np.floating) else 0, dtype=dtype)
+            for field, dtype in fields.items()
+        }
+        self.rolling_stats = {field: RollingStats() for field in self.fields}
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp: dt.datetime, record: dict):
+        """Append a record, overwriting the oldest one when full."""
+        if self.fields is None:
+            self.__allocate([
+                key for key, value in record.items()
+                if isinstance(value, Real) and not isinstance(value, bool)
+            ])
+
+        # Slot of the new entry and its mirror `capacity` slots away
+        index = (self.head + self.size) % self.capacity
+        mirror = index + self.capacity
+
+        full = self.size == self.capacity
+
+        timestamp_ns = (timestamp - EPOCH) // dt.timedelta(microseconds=1) * 1000
+        self.timestamps_ns[index] = self.timestamps_ns[mirror] = timestamp_ns
+        for field, column in self.columns.items():
+            value = record.get(field)
+            if not isinstance(value, Real):
+                value = np.nan
+            stats = self.rolling_stats[field]
+            if full:
+                stats.evict(self.appended - self.capacity, float(column[index]))
+            column[index] = column[mirror] = value
+            stats.push(self.appended, float(column[index]))
+        self.appended += 1
+
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.head = (self.head + 1) % self.capacity
+
+    def extend(self, timestamps_ns: np.ndarray, columns: dict[str, np.ndarray]):
+        """Append many records at once, e.g., when replaying a log.
+
+        If no fields have been set yet, they are taken from `columns`.
+        """
+        if self.fields is None:
+            self.__allocate({field: column.dtype for field, column in columns.items()})
+
+        # Only the newest `capacity` records can survive
+        timestamps_ns = timestamps_ns[-self.capacity:]
+        n = len(timestamps_ns)
+        if n == 0:
+            return
+
+        index = (self.head + self.size + np.arange(n)) % self.capacity
+        mirror = index + self.capacity
+        self.timestamps_ns[index] = self.timestamps_ns[mirror] = timestamps_ns
+        for field, column in self.columns.items():
+            values = columns[field][-n:] if field in columns else np.nan
+            column[index] = column[mirror] = values
+
+        overflow = max(0, self.size + n - self.capacity)
+        self.size = min(self.size + n, self.capacity)
+        self.head = (self.head + overflow) % self.capacity
+        self.appended += n
+
+        # Rebuild the rolling stats over the new window
+        first_seq = self.appended - self.size
+        for field, column in self.columns.items():
+            stats = self.rolling_stats[field] = RollingStats()
+            for seq, value in enumerate(column[self.__window(None)].tolist(), first_seq):
+                stats.push(seq, float(value))
+
+    def stats(self, field: str) -> tuple[float, float, float]:
+        """Rolling (min, mean, max) of `field` over the whole buffer."""
+        if field not in self.rolling_stats:
+            return math.nan, math.nan, math.nan
+        return self.rolling_stats[field].get()
+
+    def last_row(self) -> tuple:
+        """The most recent entry as (timestamp_ns, *values) in field order."""
+        index = self.head + self.size - 1
+        return (self.timestamps_ns[index], *(column[index] for column in self.columns.values()))
+
+    def __window(self, last: int | None) -> slice:
+        n = self.size if last is None else min(last, self.size)
+        start = self.head + self.size - n
+        return slice(start, start + n)
+
+    def timestamps(self, last: int | None = None) -> np.ndarray:
+        """Timestamps of the last `last` entries (default all) as datetime64[ns]."""
+        return self.timestamps_ns[self.__window(last)].view('datetime64[ns]')
+
+    def column(self, field: str, last: int | None = None) -> np.ndarray:
+        """Values of `field` for the last `last` entries (default all).
+
+        The returned array is a read-only view into the buffer and is only
+        valid until the next append.
+        """
+        if field not in self.columns:
+            return np.empty(0)
+        view = self.columns[field][self.__window(last)]
+        view.flags.writeable = False
+        return view
+
+    def last(self) -> tuple[dt.datetime, dict] | None:
+        """The most recent (timestamp, record) pair."""
+        if self.size == 0:
+            return None
+        index = self.head + self.size - 1
+        timestamp = EPOCH + dt.timedelta(microseconds=int(self.timestamps_ns[index]) // 1000)
+        return timestamp, {field: column[index].item() for field, column in self.columns.items()}
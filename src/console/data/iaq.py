@@ -1,16 +1,33 @@
 """See https://github.com/airgradienthq/arduino/blob/master/docs/local-server.md for more information on the AirGradient local server API."""
 
 from typing import Any
+from functools import partial
+import logging
+from numbers import Real
 
 import httpx
+import numpy as np
 
-from console.data.source import DataSource
+from console.data.aio import AsyncDataSource
+from console.data.retry import RetryPolicy
+from console.data.source import DataSource, Scheduler, SCHEDULER
 from console.data.utils import pad
 
+
+logger = logging.getLogger(__name__)
+
 REFRESH_RATE = 10
+# A device on the local network is either there or not, so give up quickly
+RETRY_POLICY = RetryPolicy(base_delay=REFRESH_RATE, max_delay=120, failure_threshold=3, open_duration=300)
 
 SERIAL_NO = '404cca6b9fd4'
-BASE_URL = f'http://airgradient_{SERIAL_NO}.local'
+
+
+def device_url(serial_no: str) -> str:
+    return f'http://airgradient_{serial_no}.local'
+
+
+BASE_URL = device_url(SERIAL_NO)
 
 VARIABLES = [
     # 'atmp',
@@ -54,15 +71,13 @@ DATA_LABELS = {
     'model': 'Model'
 }
 
-def request_data() -> dict[str, Any]:
-    try:
-        response = httpx.get(BASE_URL + '/measures/current')
-    except httpx.TimeoutException:
-        return {}
+HISTORY_FIELDS = [DATA_LABELS[variable] for variable in VARIABLES if variable != 'model']
+
 
+def parse_measures(measures: dict[str, Any]) -> dict[str, Any]:
     output = {}
     for variable in VARIABLES:
-        output[DATA_LABELS[variable]] = response.json().get(variable, 'NULL')
+        output[DATA_LABELS[variable]] = measures.get(variable, 'NULL')
 
     # Reading is in Celsius, convert to Fahrenheit
     if output['Temperature [F]'] != 'NULL':
@@ -71,10 +86,109 @@ def request_data() -> dict[str, Any]:
     return output
 
 
-def make_data_source() -> DataSource:
+def request_data(base_url: str = BASE_URL) -> dict[str, Any]:
+    try:
+        response = httpx.get(base_url + '/measures/current')
+    except httpx.TransportError as e:
+        logger.warning('%s: request failed: %r', base_url, e)
+        return {}
+
+    return parse_measures(response.json())
+
+
+async def request_data_async(client: httpx.AsyncClient, base_url: str = BASE_URL) -> dict[str, Any]:
+    try:
+        response = await client.get(base_url + '/measures/current')
+    except httpx.TransportError as e:
+        logger.warning('%s: request failed: %r', base_url, e)
+        return {}
+
+    return parse_measures(response.json())
+
+
+def make_data_source(serial_no: str = SERIAL_NO, log_dir: str | None = None) -> DataSource:
+    default = {DATA_LABELS[variable]: 'NULL' for variable in VARIABLES}
+    if serial_no == SERIAL_NO:
+        name, request_func = "airgradient", request_data
+    else:
+        name = f"airgradient_{serial_no}"
+        request_func = partial(request_data, base_url=device_url(serial_no))
+    return DataSource(name, request_func, REFRESH_RATE, default, HISTORY_FIELDS, log_dir, RETRY_POLICY)
+
+
+def make_async_data_source(serial_no: str = SERIAL_NO, log_dir: str | None = None) -> AsyncDataSource:
     default = {DATA_LABELS[variable]: 'NULL' for variable in VARIABLES}
-    return DataSource("airgradient", request_data, REFRESH_RATE, default)
+    if serial_no == SERIAL_NO:
+        name, request_func = "airgradient", request_data_async
+    else:
+        name = f"airgradient_{serial_no}"
+        request_func = partial(request_data_async, base_url=device_url(serial_no))
+    return AsyncDataSource(name, request_func, REFRESH_RATE, default, HISTORY_FIELDS, log_dir, RETRY_POLICY)
+
+
+class Fleet:
+    """A fleet of AirGradient devices polled concurrently.
+
+    Each device is its own data source, with its own history and status, and
+    all of them share the pooled connections of the asyncio backend.  The
+    devices are updated by `scheduler`, and the per-metric min/mean/max
+    across devices is only recomputed when a device reports new data.
+    `version` counts those recomputations.
+    """
+
+    def __init__(self, serial_nos: list[str], log_dir: str | None = None, scheduler: Scheduler = SCHEDULER):
+        self.devices = {
+            serial_no: make_async_data_source(serial_no, log_dir)
+            for serial_no in serial_nos
+        }
+        self.aggregate = {field: ('NULL', 'NULL', 'NULL') for field in HISTORY_FIELDS}
+        self.version = 0
+        self.stale = False
+        for device in self.devices.values():
+            device.subscribe(self.__invalidate)
+        scheduler.add(*self.devices.values())
+
+    def __invalidate(self, device: DataSource):
+        self.stale = True
+
+    def update(self) -> dict[str, tuple]:
+        if self.stale:
+            self.stale = False
+            self.__aggregate()
+            self.version += 1
+
+        return self.aggregate
+
+    def close(self):
+        for device in self.devices.values():
+            device.close()
+
+    def statuses(self) -> dict[str, str]:
+        return {serial_no: device.status for serial_no, device in self.devices.items()}
+
+    def __aggregate(self):
+        values = np.array([
+            [
+                value if isinstance(value := device.data.get(field), Real) else np.nan
+                for field in HISTORY_FIELDS
+            ]
+            for device in self.devices.values()
+        ])
+        for field, column in zip(HISTORY_FIELDS, values.T):
+            column = column[~np.isnan(column)]
+            if len(column) > 0:
+                self.aggregate[field] = (column.min(), column.mean(), column.max())
+            else:
+                self.aggregate[field] = ('NULL', 'NULL', 'NULL')
 
 
 def present_data(data: dict[str, Any]) -> list[str]:
-    return [pad(key, value, 30) for key, value in data.items()]
\ No newline at end of file
+    return [pad(key, value, 30) for key, value in data.items()]
+
+
+def present_aggregate(aggregate: dict[str, tuple]) -> list[str]:
+    """Format min/mean/max across a fleet."""
+    return [
+        pad(key, '/'.join(f'{y:.0f}' if isinstance(y, Real) else str(y) for y in values), 30)
+        for key, values in aggregate.items()
+    ]
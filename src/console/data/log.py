@@ -0,0 +1,147 @@
+"""Append-only on-disk log of a data source's history.
+
+The file starts with a small header describing the record layout, followed by
+fixed-width little-endian records of an int64 timestamp (nanoseconds since the
+epoch) and one value per history field.  Because every record has the same
+width, the file can be memory-mapped and replayed straight into a
+`RingBuffer` without any parsing.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from console.data.history import RingBuffer
+
+
+MAGIC = b'CLOG'
+VERSION = 1
+HEADER_PREFIX = np.dtype([('magic', 'S4'), ('version', '<u4'), ('length', '<u4')])
+
+
+def record_dtype(history: RingBuffer) -> np.dtype:
+    return np.dtype(
+        [('timestamp', '<i8')]
+        + [(field, column.dtype.newbyteorder('<')) for field, column in history.columns.items()]
+    )
+
+
+class HistoryLog:
+    """Append-only log of a `RingBuffer`.
+
+    Records are buffered in memory and written in batches of `batch_size`, or
+    once the oldest buffered record is `flush_interval` seconds old.  The file
+    is compacted down to the newest `capacity` records that are at most
+    `retention` seconds old when the log is opened and whenever the file grows
+    past twice the capacity.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            retention: float,
+            capacity: int,
+            batch_size: int = 64,
+            flush_interval: float = 60,
+        ):
+        self.path = path
+        self.retention = retention
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.dtype = None
+        self.num_records = 0
+        self.batch = []
+        self.batch_started = None
+
+    def __read_header(self) -> tuple[np.dtype, int] | None:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_PREFIX.itemsize:
+            return None
+        with open(self.path, 'rb') as file:
+            prefix = np.frombuffer(file.read(HEADER_PREFIX.itemsize), dtype=HEADER_PREFIX)[0]
+            if prefix['magic'] != MAGIC or prefix['version'] != VERSION:
+                return None
+            descr = json.loads(file.read(prefix['length']))
+        dtype = np.dtype([tuple(item) for item in descr])
+        return dtype, HEADER_PREFIX.itemsize + int(prefix['length'])
+
+    def __write(self, path: str, dtype: np.dtype, records: np.ndarray):
+        descr = json.dumps(dtype.descr).encode()
+        # Pad so that records start 8-byte aligned
+        descr += b' ' * (-(HEADER_PREFIX.itemsize + len(descr)) % 8)
+        prefix = np.array([(MAGIC, VERSION, len(descr))], dtype=HEADER_PREFIX)
+        with open(path, 'wb') as file:
+            file.write(prefix.tobytes())
+            file.write(descr)
+            file.write(records.astype(dtype).tobytes())
+
+    def read(self) -> np.ndarray:
+        """Memory-map the records on disk."""
+        header = self.__read_header()
+        if header is None:
+            return np.empty(0, dtype=self.dtype or [('timestamp', '<i8')])
+        dtype, offset = header
+        num_records = (os.path.getsize(self.path) - offset) // dtype.itemsize
+        if num_records == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(num_records,))
+
+    def replay(self, history: RingBuffer):
+        """Load the retained records into `history` and compact the file."""
+        records = self.__retained(self.read())
+        if len(records) > 0:
+            history.extend(
+                records['timestamp'],
+                {field: records[field] for field in records.dtype.names[1:]}
+            )
+
+        if history.fields is not None:
+            self.dtype = record_dtype(history)
+            self.__compact(records)
+
+    def append(self, history: RingBuffer):
+        """Log the newest entry of `history`."""
+        if self.dtype is None:
+            self.dtype = record_dtype(history)
+            self.__compact(self.__retained(self.read()))
+
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        self.batch.append(history.last_row())
+
+        if len(self.batch) >= self.batch_size or time.monotonic() - self.batch_started >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        records = np.array(self.batch, dtype=self.dtype)
+        with open(self.path, 'ab') as file:
+            file.write(records.tobytes())
+        self.num_records += len(records)
+        self.batch = []
+
+        if self.num_records > 2 * self.capacity:
+            self.__compact(self.__retained(self.read()))
+
+    def __retained(self, records: np.ndarray) -> np.ndarray:
+        cutoff = time.time_ns() - int(self.retention * 1e9)
+        records = records[-self.capacity:]
+        return records[records['timestamp'] >= cutoff]
+
+    def __compact(self, records: np.ndarray):
+        """Rewrite the file with only `records`, in the current layout."""
+        converted = np.zeros(len(records), dtype=self.dtype)
+        for field in self.dtype.names:
+            if field in records.dtype.names:
+                converted[field] = records[field]
+            elif np.issubdtype(self.dtype[field], np.floating):
+                converted[field] = np.nan
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        self.__write(temp_path, self.dtype, converted)
+        os.replace(temp_path, self.path)
+        self.num_records = len(converted)
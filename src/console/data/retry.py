@@ -0,0 +1,82 @@
+"""Retry policies and circuit breakers for data sources.
+
+A failing source retries with jittered exponential backoff.  After enough
+consecutive failures its circuit opens and it stops making requests
+altogether for a while, so a dead device costs neither pool workers nor frame
+time.  Once that time is up, a single trial request either closes the circuit
+again or re-opens it.
+"""
+import random
+import time
+
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class RetryPolicy:
+    """How a data source retries failed requests.
+
+    The n-th consecutive failure waits a random time between 0 and
+    `base_delay * 2**(n - 1)` seconds, capped at `max_delay`.  After
+    `failure_threshold` consecutive failures the circuit opens for
+    `open_duration` seconds.
+    """
+
+    def __init__(
+            self,
+            base_delay: float = 5,
+            max_delay: float = 300,
+            failure_threshold: int = 5,
+            open_duration: float = 600,
+        ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+
+    def backoff(self, failures: int) -> float:
+        ceiling = min(self.max_delay, self.base_delay * 2 ** min(failures - 1, 32))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one source against a `RetryPolicy`.
+
+    Times are `time.monotonic` seconds.
+    """
+
+    def __init__(self, policy: RetryPolicy | None = None):
+        self.policy = policy or RetryPolicy()
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def allow(self, now: float | None = None) -> bool:
+        """Whether a request may be made now.
+
+        An open circuit turns half-open once `open_duration` is up, which
+        lets through a single trial request.
+        """
+        now = time.monotonic() if now is None else now
+        if now < self.retry_at:
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def record_failure(self, now: float | None = None) -> float:
+        """Count a failure and return the seconds until the next attempt."""
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.policy.failure_threshold:
+            self.state = OPEN
+            delay = self.policy.open_duration
+        else:
+            delay = self.policy.backoff(self.failures)
+        self.retry_at = now + delay
+        return delay
@@ -0,0 +1,85 @@
+"""Passing request results from worker processes through shared memory.
+
+A worker moves every NumPy array in its result into a single shared memory
+block and returns only a small skeleton of the result, with the arrays
+replaced by references into the block.  The parent copies the arrays back
+out and frees the block, so large arrays are never pickled.
+"""
+from typing import Any, Callable, NamedTuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+ALIGNMENT = 64
+
+
+class SharedArray(NamedTuple):
+    offset: int
+    dtype: str
+    shape: tuple[int, ...]
+
+
+def pack(result: Any) -> tuple[str | None, Any]:
+    """Move the arrays in `result` into a shared memory block.
+
+    Returns the name of the block, or None if there were no arrays, and the
+    skeleton of `result`.  Dicts, lists and tuples are searched for arrays.
+    """
+    arrays = []
+    size = 0
+
+    def strip(value):
+        nonlocal size
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items()}
+        if type(value) in (list, tuple):
+            return type(value)(strip(item) for item in value)
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            offset = -(-size // ALIGNMENT) * ALIGNMENT
+            arrays.append((offset, value))
+            size = offset + value.nbytes
+            return SharedArray(offset, value.dtype.str, value.shape)
+        return value
+
+    skeleton = strip(result)
+    if not arrays:
+        return None, skeleton
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for offset, array in arrays:
+        np.ndarray(array.shape, array.dtype, block.buf, offset)[...] = array
+    name = block.name
+    block.close()
+    # The parent unlinks the block, so this process must not track it
+    resource_tracker.unregister(block._name, 'shared_memory')
+
+    return name, skeleton
+
+
+def unpack(name: str | None, skeleton: Any) -> Any:
+    """Rebuild a result from `pack`, and free its shared memory block."""
+    if name is None:
+        return skeleton
+
+    block = shared_memory.SharedMemory(name=name)
+
+    def fill(value):
+        if isinstance(value, SharedArray):
+            return np.ndarray(value.shape, np.dtype(value.dtype), block.buf, value.offset).copy()
+        if isinstance(value, dict):
+            return {key: fill(item) for key, item in value.items()}
+        if type(value) in (list, tuple):
+            return type(value)(fill(item) for item in value)
+        return value
+
+    try:
+        return fill(skeleton)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def run_packed(func: Callable) -> tuple[str | None, Any]:
+    """Call `func` in a worker process and pack its result."""
+    return pack(func())
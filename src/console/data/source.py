@@ -1,16 +1,294 @@
 from typing import Callable
 import datetime as dt
+import heapq
+import collections
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
 from concurrent import futures
 
+from console.data import shared
+from console.data.history import RingBuffer
+from console.data.log import HistoryLog
+from console.data.retry import CircuitBreaker, RetryPolicy, OPEN, HALF_OPEN
+from console.profiler import Histogram, profiled
+
+
+logger = logging.getLogger(__name__)
+
+COALESCE, DROP_OLDEST = 'coalesce', 'drop-oldest'
+
+
+class Task:
+    """A request queued on, or running in, a `DataRetriever`."""
+
+    def __init__(self, name: str, func: Callable, timeout: float, isolated: bool = False):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.isolated = isolated
+        self.future = futures.Future()
+        self.submitted = time.monotonic()
+        self.started = None
+        # Set once the task times out or is dropped while running
+        self.abandoned = False
+
 
 class DataRetriever:
+    """Runs requests on daemon worker threads, or on a process pool if `isolated`.
+
+    Each source has at most one request outstanding.  Submitting another
+    while one is outstanding either returns the outstanding one ('coalesce')
+    or replaces it ('drop-oldest').  At most `max_queued` requests wait for a
+    worker; past that, the oldest waiting request is dropped.
+
+    A request that is not done within its timeout fails with a TimeoutError.
+    Deadlines are kept in a heap by a single watchdog thread.  A hung thread
+    cannot be stopped, so a spare worker takes its place, and the hung one
+    retires once it returns, discarding its result.  Shutting down does not
+    wait for hung requests.
+
+    Isolated requests keep CPU-bound decoding off the GIL of the render
+    loop.  They wait in a queue of their own, with the same bound, until one
+    of `max_processes` worker processes is free.  Their arrays come back
+    through shared memory, see `console.data.shared`, and are copied out on
+    the pool's own thread.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 2,
+            max_processes: int = 1,
+            max_queued: int = 8,
+            policy: str = COALESCE,
+            timeout: float = 30,
+        ):
+        self.max_workers = max_workers
+        self.max_processes = max_processes
+        self.max_queued = max_queued
+        self.policy = policy
+        self.timeout = timeout
+
+        lock = threading.RLock()
+        self.condition = threading.Condition(lock)
+        self.queue = collections.deque()
+        self.num_workers = 0
+        self.num_running = 0
+        self.running = True
+        self.processes = None
+        self.isolated_queue = collections.deque()
+        # Isolated tasks running on the current process pool
+        self.in_processes = set()
+
+        # Heap of (deadline, sequence number, task) watched by one thread
+        self.deadlines = []
+        self.counter = itertools.count()
+        self.deadline_changed = threading.Condition(lock)
+        self.watchdog = None
 
-    def __init__(self, max_workers: int = 2):
-        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
         self.pool = {}
+        self.tasks = {}
+
+        self.wait = Histogram()
+        self.latency = Histogram()
+        self.dropped = 0
+        self.timed_out = 0
+
+    def submit(
+            self,
+            name: str,
+            func: Callable,
+            isolated: bool = False,
+            timeout: float | None = None,
+        ) -> futures.Future:
+        with self.condition:
+            outstanding = self.tasks.get(name)
+            if outstanding is not None:
+                if self.policy == COALESCE:
+                    return outstanding.future
+                self.__drop(outstanding)
+
+            task = Task(name, func, self.timeout if timeout is None else timeout, isolated)
+            self.tasks[name] = task
+            self.pool[name] = task.future
+            self.__watch(task)
+
+            queue = self.isolated_queue if isolated else self.queue
+            if len(queue) >= self.max_queued:
+                self.__drop(queue[0])
+            queue.append(task)
+            if isolated:
+                self.__dispatch_isolated()
+            else:
+                if self.num_workers < self.max_workers:
+                    self.__start_worker()
+                self.condition.notify()
+
+        return task.future
+
+    def __start_worker(self):
+        self.num_workers += 1
+        threading.Thread(target=self.__work, daemon=True).start()
+
+    def __work(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    self.num_workers -= 1
+                    return
+                task = self.queue.popleft()
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                self.__start(task)
+
+            try:
+                result = task.func()
+            except Exception as e:
+                self.__finish(task, exception=e)
+            else:
+                self.__finish(task, result)
+
+            with self.condition:
+                self.num_running -= 1
+                # A spare has taken the place of this worker
+                if task.abandoned:
+                    self.num_workers -= 1
+                    return
+
+    def __watch(self, task: Task):
+        deadline = task.submitted + task.timeout
+        heapq.heappush(self.deadlines, (deadline, next(self.counter), task))
+        if self.watchdog is None:
+            self.watchdog = threading.Thread(target=self.__watchdog, daemon=True)
+            self.watchdog.start()
+        elif self.deadlines[0][2] is task:
+            self.deadline_changed.notify()
+
+    def __watchdog(self):
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                while self.deadlines and (self.deadlines[0][0] <= now or self.deadlines[0][2].future.done()):
+                    _, _, task = heapq.heappop(self.deadlines)
+                    self.__expire(task)
+                timeout = self.deadlines[0][0] - now if self.deadlines else None
+                self.deadline_changed.wait(timeout)
+
+    def __start(self, task: Task):
+        task.started = time.monotonic()
+        self.wait.record(task.started - task.submitted)
+        self.num_running += 1
+
+    def __finish(self, task: Task, result: dict | None = None, exception: Exception | None = None):
+        with self.condition:
+            if self.tasks.get(task.name) is task:
+                del self.tasks[task.name]
+            if task.future.done():
+                # Timed out or dropped in the meantime
+                return
+            self.latency.record(time.monotonic() - task.started)
+            if exception is None:
+                task.future.set_result(result)
+            else:
+                task.future.set_exception(exception)
+
+    def __drop(self, task: Task):
+        """Cancel a waiting task, or abandon a running one."""
+        self.dropped += 1
+        if not task.future.cancel() and not task.future.done():
+            self.__abandon(task)
+            task.future.set_exception(futures.CancelledError(f'{task.name} was replaced'))
+        elif self.tasks.get(task.name) is task:
+            del self.tasks[task.name]
+        self.__dequeue(task)
+
+    def __expire(self, task: Task):
+        with self.condition:
+            if task.future.done():
+                return
+            self.timed_out += 1
+            self.__abandon(task)
+            task.future.set_exception(TimeoutError(f'{task.name} timed out after {task.timeout} s'))
+
+    def __abandon(self, task: Task):
+        if self.tasks.get(task.name) is task:
+            del self.tasks[task.name]
+        if self.__dequeue(task) or task.started is None or not self.running:
+            return
+        if task.isolated:
+            # The hung process finishes on its own, and its result is still
+            # unpacked, but later requests get a fresh pool
+            self.__restart_processes()
+            self.__dispatch_isolated()
+        else:
+            # Make up for the worker stuck on this task until it returns
+            task.abandoned = True
+            self.__start_worker()
 
-    def submit(self, name: str, func: Callable):
-        self.pool[name] = self.executor.submit(func)
+    def __dequeue(self, task: Task) -> bool:
+        """Remove `task` if it is still waiting, and say whether it was."""
+        queue = self.isolated_queue if task.isolated else self.queue
+        if task in queue:
+            queue.remove(task)
+            return True
+        return False
+
+    def __start_processes(self):
+        # Forking a process with threads is unsafe, so start workers from a
+        # clean server process, which imports but does not run the script
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.processes = futures.ProcessPoolExecutor(
+            max_workers=self.max_processes,
+            mp_context=multiprocessing.get_context(method),
+        )
+
+    def __restart_processes(self):
+        self.processes.shutdown(wait=False, cancel_futures=True)
+        self.__start_processes()
+        self.in_processes.clear()
+
+    def __dispatch_isolated(self):
+        """Hand waiting isolated tasks to free worker processes."""
+        while self.isolated_queue and len(self.in_processes) < self.max_processes:
+            task = self.isolated_queue.popleft()
+            if task.future.set_running_or_notify_cancel():
+                self.__submit_isolated(task)
+
+    def __submit_isolated(self, task: Task):
+        if self.processes is None:
+            self.__start_processes()
+
+        # A process is free, so the task starts right away
+        self.__start(task)
+        self.in_processes.add(task)
+
+        def unpack(packed: futures.Future):
+            # Always unpack, to free the shared memory
+            try:
+                result = shared.unpack(*packed.result())
+            except Exception as e:
+                self.__finish(task, exception=e)
+            else:
+                self.__finish(task, result)
+            with self.condition:
+                self.num_running -= 1
+                self.in_processes.discard(task)
+                if self.running:
+                    self.__dispatch_isolated()
+
+        try:
+            packed = self.processes.submit(shared.run_packed, task.func)
+        except futures.process.BrokenProcessPool:
+            # A worker died, e.g., in a crashing decoder; start over
+            self.__restart_processes()
+            packed = self.processes.submit(shared.run_packed, task.func)
+        packed.add_done_callback(unpack)
 
     def is_done(self, name: str):
         return self.pool[name].done()
@@ -21,53 +299,221 @@ class DataRetriever:
         else:
             return None
 
+    def metrics(self) -> dict:
+        """Queue depth, in-flight requests, drops, timeouts and latencies."""
+        with self.condition:
+            return {
+                'queued': len(self.queue) + len(self.isolated_queue),
+                'running': self.num_running,
+                'workers': self.num_workers,
+                'dropped': self.dropped,
+                'timed_out': self.timed_out,
+                'wait': self.wait.summary(),
+                'latency': self.latency.summary(),
+            }
+
     def shutdown(self):
-        self.executor.shutdown()
+        """Cancel outstanding requests, without waiting for running ones."""
+        with self.condition:
+            self.running = False
+            for task in list(self.tasks.values()):
+                self.__drop(task)
+            self.condition.notify_all()
+            self.deadline_changed.notify()
+        if self.processes is not None:
+            self.processes.shutdown(wait=False, cancel_futures=True)
 
 
 REQUEST_POOL = DataRetriever()
 
 
 class DataSource:
+    """Data refreshed in the background every `refresh_frequency` seconds.
+
+    A request that raises or returns {} is a failure, and is retried
+    according to `retry_policy`.  Deadlines are kept on the monotonic clock,
+    in `next_due_ns`, so that a `Scheduler` only has to touch sources that
+    are due.  `version` counts the responses stored so far, and observers
+    are told about each one, so consumers need not poll.
+
+    Set `isolated` to run requests with heavy decoding in a worker process;
+    `request_func` must then be picklable, e.g., a module-level function.
+    """
+
     def __init__(
             self,
             name: str,
             request_func: Callable,
-            refresh_frequency: int,
+            refresh_frequency: float,
             default_data: dict = {},
+            history_fields: dict | list | None = None,
+            log_dir: str | None = None,
+            retry_policy: RetryPolicy | None = None,
+            isolated: bool = False,
         ):
         self.name = name
         self.request_func = request_func
+        self.isolated = isolated
         self.refresh_frequency = refresh_frequency
+        self.refresh_ns = int(refresh_frequency * 1e9)
+        self.next_due_ns = 0
+        self.scheduler = None
 
         self.start_time = dt.datetime.now(dt.UTC)
         self.last_update = dt.datetime(1960,1,1).astimezone(dt.UTC)
 
         self.data = default_data
-        self.status = 'idle'
+        self.version = 0
+        self.observers = []
+        self.pending = False
+        self.breaker = CircuitBreaker(retry_policy)
+
+        self.max_history_len = int(3*24*60*60 // refresh_frequency)
+        self.history = RingBuffer(self.max_history_len, history_fields)
 
-        self.history = []
-        self.max_history_len = 3*24*60*60 // refresh_frequency
+        # Persist the history across restarts
+        self.log = None
+        if log_dir is not None:
+            self.log = HistoryLog(
+                os.path.join(log_dir, f'{name}.log'),
+                retention=self.max_history_len * refresh_frequency,
+                capacity=self.max_history_len,
+            )
+            self.log.replay(self.history)
 
-    def update(self):
-        needs_refresh = (dt.datetime.now(dt.UTC) - self.last_update).seconds > self.refresh_frequency
-        if needs_refresh and self.status == 'idle':
-            REQUEST_POOL.submit(self.name, self.request_func)
-            self.status = 'pending'
+    @property
+    def status(self) -> str:
+        """One of 'idle', 'pending', 'retrying', 'open' or 'half-open'."""
+        if self.pending:
+            return 'half-open' if self.breaker.state == HALF_OPEN else 'pending'
+        if self.breaker.state == OPEN:
+            return 'open'
+        return 'retrying' if self.breaker.failures > 0 else 'idle'
 
-        if self.status == 'pending':
-            response = REQUEST_POOL.get_result(self.name)
+    @profiled('source', lambda self: self.name)
+    def update(self, now_ns: int | None = None):
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+
+        if self.pending:
+            try:
+                response = REQUEST_POOL.get_result(self.name)
+            except Exception as e:
+                logger.warning('%s: request failed: %r', self.name, e)
+                response = {}
             # Response of None implies no new data
-            # Response of {} implies an error
             if response is not None:
-                self.status = 'idle'
-                if len(response) > 0:
-                    self.data = response
-                    self.last_update = dt.datetime.now(dt.UTC)
-                    self.status = 'idle'
+                self.pending = False
+                self.receive(response, now_ns)
 
-                    self.history.append((dt.datetime.now(dt.UTC), self.data))
-                    if len(self.history) > self.max_history_len:
-                        self.history.pop(0)
+        if not self.pending and now_ns >= self.next_due_ns and self.breaker.allow(now_ns / 1e9):
+            future = REQUEST_POOL.submit(self.name, self.request_func, self.isolated)
+            self.pending = True
+            future.add_done_callback(lambda future: self.notify())
 
         return self.data
+
+    def notify(self):
+        """Called from any thread when there is something to collect."""
+        if self.scheduler is not None:
+            self.scheduler.wake(self)
+
+    def receive(self, response: dict, now_ns: int | None = None):
+        """Store a completed response, or count it as a failure.
+
+        Either way, set the deadline for the next request.
+        """
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        if len(response) > 0:
+            if self.breaker.failures > 0:
+                logger.info('%s: recovered after %d failures', self.name, self.breaker.failures)
+            self.breaker.record_success()
+            self.store(response)
+            self.next_due_ns = now_ns + self.refresh_ns
+        else:
+            delay = self.breaker.record_failure(now_ns / 1e9)
+            self.next_due_ns = now_ns + int(delay * 1e9)
+            logger.warning(
+                '%s: failure %d, circuit %s, next attempt in %.1f s',
+                self.name, self.breaker.failures, self.breaker.state, delay
+            )
+
+    def subscribe(self, callback: Callable[['DataSource'], None]):
+        """Call `callback` with this source whenever it stores new data.
+
+        Callbacks run on the thread that updates the source, i.e., the main
+        loop, so they may touch pygame.
+        """
+        self.observers.append(callback)
+
+    def unsubscribe(self, callback: Callable[['DataSource'], None]):
+        self.observers.remove(callback)
+
+    def store(self, response: dict):
+        """Store a completed response and notify the observers.
+
+        A response of {} implies an error and is ignored.
+        """
+        if len(response) > 0:
+            self.data = response
+            self.version += 1
+            self.last_update = dt.datetime.now(dt.UTC)
+            self.history.append(self.last_update, self.data)
+            if self.log is not None:
+                self.log.append(self.history)
+            for callback in self.observers:
+                callback(self)
+
+    def close(self):
+        """Write out anything still buffered."""
+        if self.log is not None:
+            self.log.flush()
+
+
+class Scheduler:
+    """Updates data sources only when they are due.
+
+    Deadlines of all sources are kept in one heap, so a frame in which
+    nothing is due costs a single comparison.  A source with a request in
+    flight is off the heap, and is woken up by its request finishing.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.ready = queue.SimpleQueue()
+
+    def add(self, *sources: DataSource):
+        for source in sources:
+            source.scheduler = self
+            self.__push(source)
+
+    def wake(self, source: DataSource):
+        """Update `source` on the next frame; safe to call from any thread."""
+        self.ready.put(source)
+
+    def __push(self, source: DataSource):
+        if source.next_due_ns is not None and not source.pending:
+            heapq.heappush(self.heap, (source.next_due_ns, next(self.counter), source))
+
+    def update(self, now_ns: int | None = None) -> list[DataSource]:
+        """Update the sources that are due, and return them."""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+
+        due = []
+        while not self.ready.empty():
+            due.append(self.ready.get())
+        while self.heap and self.heap[0][0] <= now_ns:
+            deadline, _, source = heapq.heappop(self.heap)
+            # Entries are left behind when a deadline moves; skip those
+            if deadline == source.next_due_ns:
+                due.append(source)
+
+        due = list(dict.fromkeys(due))
+        for source in due:
+            source.update(now_ns)
+            self.__push(source)
+
+        return due
+
+
+SCHEDULER = Scheduler()
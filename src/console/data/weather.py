@@ -1,21 +1,38 @@
 """Weather data from https://open-meteo.com/."""
 from typing import Any
 
+from functools import partial
 import datetime as dt
+import logging
 import zoneinfo as zi
 
 from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 
 import httpx
+import numpy as np
 
+from console.data.aio import AsyncDataSource
+from console.data.cache import ResponseCache
+from console.data.retry import RetryPolicy
 from console.data.source import DataSource
 from console.data.utils import pad
 
 
+logger = logging.getLogger(__name__)
+
 REFRESH_RATE = 15*60
+# Back off gently, as failures are mostly rate limiting
+RETRY_POLICY = RetryPolicy(base_delay=60, max_delay=REFRESH_RATE, failure_threshold=5, open_duration=2*REFRESH_RATE)
+
+# Responses are cached on disk, and served without a request for a little less
+# than the refresh rate so that each scheduled refresh finds them expired.
+RESPONSE_CACHE = ResponseCache('weather', ttl=REFRESH_RATE - 60)
 
 LAT, LONG = 32.038537, -81.09347
+# Sites fetched together by `request_sites_data`, as (latitude, longitude)
+SITES = [(LAT, LONG)]
 TIMEZONE = 'US/Eastern'
+TIMEZONE_INFO = zi.ZoneInfo(TIMEZONE)
 BASE_URL = "https://api.open-meteo.com/v1/forecast"
 HOURLY_VARIABLES = [
     "temperature_2m",
@@ -64,7 +81,47 @@ def weather_api(url: str, params: any) -> list[WeatherApiResponse]:
     """
     params["format"] = "flatbuffers"
 
-    response = httpx.get(url, params=params)
+    key = RESPONSE_CACHE.key(url, params)
+    content = RESPONSE_CACHE.load(key, max_age=RESPONSE_CACHE.ttl)
+    if content is None:
+        try:
+            response = httpx.get(url, params=params, headers=RESPONSE_CACHE.conditional_headers(key))
+            content = cache_response(key, response)
+        except Exception:
+            # Fall back to the last good payload, however old
+            content = RESPONSE_CACHE.load(key)
+            if content is None:
+                raise
+
+    return decode_messages(content)
+
+
+async def weather_api_async(client: httpx.AsyncClient, url: str, params: any) -> list[WeatherApiResponse]:
+    """Async version of `weather_api` using a shared client."""
+    params["format"] = "flatbuffers"
+
+    key = RESPONSE_CACHE.key(url, params)
+    content = RESPONSE_CACHE.load(key, max_age=RESPONSE_CACHE.ttl)
+    if content is None:
+        try:
+            response = await client.get(url, params=params, headers=RESPONSE_CACHE.conditional_headers(key))
+            content = cache_response(key, response)
+        except Exception:
+            # Fall back to the last good payload, however old
+            content = RESPONSE_CACHE.load(key)
+            if content is None:
+                raise
+
+    return decode_messages(content)
+
+
+def cache_response(key: str, response: httpx.Response) -> bytes:
+    """Check a response and store its payload in the cache."""
+    if response.status_code == 304:
+        content = RESPONSE_CACHE.load(key)
+        if content is not None:
+            RESPONSE_CACHE.touch(key)
+            return content
 
     if response.status_code in [400, 429]:
         response_body = response.json()
@@ -72,7 +129,16 @@ def weather_api(url: str, params: any) -> list[WeatherApiResponse]:
 
     response.raise_for_status()
 
-    data = response.content
+    RESPONSE_CACHE.store(key, response.content, response.headers.get('etag'))
+    return response.content
+
+
+def decode_messages(data: bytes) -> list[WeatherApiResponse]:
+    """Decode length-prefixed flatbuffers messages without copying the payload.
+
+    The messages, and any arrays taken from them, are views into `data`.
+    """
+    data = memoryview(data)
     messages = []
     total = len(data)
     pos = int(0)
@@ -85,13 +151,22 @@ def weather_api(url: str, params: any) -> list[WeatherApiResponse]:
     return messages
 
 
-def request_data() -> dict[str, Any]:
-    # Setup the Open-Meteo API client with cache and retry on error
+def request_params(sites: list[tuple[float, float]] | None = None) -> dict[str, Any]:
+    """Request parameters, for a single location or a batch of `sites`.
+
+    Open-Meteo takes comma-separated coordinates and returns one message per
+    site, in the same order.
+    """
+    if sites is None:
+        latitude, longitude = LAT, LONG
+    else:
+        latitude = ",".join(str(lat) for lat, _ in sites)
+        longitude = ",".join(str(long) for _, long in sites)
 
     # The order of variables in hourly or daily is important to assign them correctly below
-    params = {
-        "latitude": LAT,
-        "longitude": LONG,
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
         "hourly": HOURLY_VARIABLES,
         "current": CURRENT_VARIABLES,
         "temperature_unit": "fahrenheit",
@@ -100,12 +175,74 @@ def request_data() -> dict[str, Any]:
         "timezone": "America/New_York",
         "forecast_days": 3,
     }
+
+
+def request_data() -> dict[str, Any]:
+    try:
+        response = weather_api(BASE_URL, params=request_params())[0]
+    except Exception as e:
+        logger.warning('Request failed: %r', e)
+        return {}
+
+    return parse_response(response)
+
+
+async def request_data_async(client: httpx.AsyncClient) -> dict[str, Any]:
+    try:
+        response = (await weather_api_async(client, BASE_URL, params=request_params()))[0]
+    except Exception as e:
+        logger.warning('Request failed: %r', e)
+        return {}
+
+    return parse_response(response)
+
+
+def request_sites_data(sites: list[tuple[float, float]] = SITES) -> dict[str, Any]:
     try:
-        response = weather_api(BASE_URL, params=params)[0]
+        responses = weather_api(BASE_URL, params=request_params(sites))
     except Exception as e:
-        print(f"Error: {e}")
+        logger.warning('Request failed: %r', e)
         return {}
 
+    return parse_sites(responses)
+
+
+async def request_sites_data_async(client: httpx.AsyncClient, sites: list[tuple[float, float]] = SITES) -> dict[str, Any]:
+    try:
+        responses = await weather_api_async(client, BASE_URL, params=request_params(sites))
+    except Exception as e:
+        logger.warning('Request failed: %r', e)
+        return {}
+
+    return parse_sites(responses)
+
+
+def parse_sites(responses: list[WeatherApiResponse]) -> dict[str, Any]:
+    """Stack the responses for several sites, with the site as the first axis.
+
+    Current values become arrays of shape (num_sites,) and hourly values
+    arrays of shape (num_sites, num_hours).  Hourly times are shared.
+    """
+    parsed = [parse_response(response) for response in responses]
+    num_hours = min(len(site['hourly']['UTC']) for site in parsed)
+
+    output = {
+        'sites': [(response.Latitude(), response.Longitude()) for response in responses],
+        'current': {
+            key: np.array([site['current'][key] for site in parsed])
+            for key in parsed[0]['current']
+        },
+        'hourly': {
+            key: np.stack([site['hourly'][key][:num_hours] for site in parsed])
+            for key in parsed[0]['hourly'] if key != 'UTC'
+        },
+    }
+    output['hourly']['UTC'] = parsed[0]['hourly']['UTC'][:num_hours]
+
+    return output
+
+
+def parse_response(response: WeatherApiResponse) -> dict[str, Any]:
     output = {}
 
     # Process first location. Add a for-loop for multiple locations or weather models
@@ -123,14 +260,12 @@ def request_data() -> dict[str, Any]:
 
 
     # Hourly values
+    # Times are a datetime64[s] column in UTC.  Local time strings are no
+    # longer built for every hour; `format_time` formats one when needed
     output['hourly'] = {}
     hourly = response.Hourly()
-    time_start_utc = hourly.Time()
-    time_end_utc = hourly.TimeEnd()
-    time_interval = hourly.Interval()
-    times_utc = [dt.datetime.fromtimestamp(time_start_utc + i*time_interval, tz=dt.UTC) for i in range((time_end_utc - time_start_utc) // time_interval)]
-    output['hourly']['UTC'] = times_utc
-    output['hourly']['Time'] = [t.astimezone(zi.ZoneInfo(TIMEZONE)).strftime('%Y-%m-%d %I:%M:%S %p %Z') for t in times_utc]
+    times_utc = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.int64)
+    output['hourly']['UTC'] = times_utc.view('datetime64[s]')
 
     for ind,var_name in enumerate(HOURLY_VARIABLES):
         var = hourly.Variables(ind)
@@ -139,13 +274,54 @@ def request_data() -> dict[str, Any]:
     return output
 
 
-def make_data_source() -> DataSource:
+def format_time(time_utc: np.datetime64 | int) -> str:
+    """Format an hourly time in the local time zone.
+
+    Nothing shows the hourly times yet.  This replaces the 'Time' column of
+    local time strings, which was built for every hour on every refresh.
+    """
+    if isinstance(time_utc, np.datetime64):
+        time_utc = time_utc.astype('datetime64[s]').astype(np.int64)
+    return dt.datetime.fromtimestamp(int(time_utc), tz=TIMEZONE_INFO).strftime('%Y-%m-%d %I:%M:%S %p %Z')
+
+
+def make_data_source(isolated: bool = False) -> DataSource:
+    """Data source for the home site.
+
+    With `isolated`, responses are decoded in a worker process, which only
+    pays off for large batched responses.
+    """
+    default = {
+        'current': {key: 'NULL' for key in DATA_LABELS.values()},
+        'hourly': {key: 'NULL' for key in DATA_LABELS.values()}
+    }
+    return DataSource("weather", request_data, REFRESH_RATE, default, retry_policy=RETRY_POLICY, isolated=isolated)
+
+
+def make_async_data_source() -> AsyncDataSource:
     default = {
         'current': {key: 'NULL' for key in DATA_LABELS.values()},
         'hourly': {key: 'NULL' for key in DATA_LABELS.values()}
     }
-    return DataSource("weather", request_data, REFRESH_RATE, default)
+    return AsyncDataSource("weather", request_data_async, REFRESH_RATE, default, retry_policy=RETRY_POLICY)
+
+
+def make_sites_data_source(sites: list[tuple[float, float]] = SITES) -> AsyncDataSource:
+    """Data source for a batch of sites, fetched in one request per refresh."""
+    default = {'sites': sites, 'current': {}, 'hourly': {}}
+    return AsyncDataSource(
+        "weather_sites",
+        partial(request_sites_data_async, sites=sites),
+        REFRESH_RATE,
+        default,
+        retry_policy=RETRY_POLICY,
+    )
 
 
 def present_data(data: dict[str, float]) -> list[str]:
     return [pad(key, value, 30) for key, value in data.items()]
+
+
+def present_site_data(data: dict[str, Any], site: int) -> list[str]:
+    """Format the current values of one site from `parse_sites` output."""
+    return present_data({key: values[site] for key, values in data['current'].items()})
@@ -0,0 +1,165 @@
+"""Opt-in timing of components, data sources and frame phases.
+
+Timings are recorded into fixed-size histograms with logarithmic buckets, so
+memory use does not grow with run time.  Profiling is off by default; when it
+is off, instrumented code only pays for a flag check.
+"""
+from typing import Callable
+from time import perf_counter
+import functools
+import json
+import math
+import os
+
+
+# Buckets cover 1 us to 10 s, 8 per decade
+BUCKETS_PER_DECADE = 8
+MIN_EXPONENT, MAX_EXPONENT = -6, 1
+NUM_BUCKETS = (MAX_EXPONENT - MIN_EXPONENT) * BUCKETS_PER_DECADE + 1
+
+
+class Histogram:
+    """Fixed-size histogram of durations in seconds."""
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds: float):
+        if seconds > 0:
+            bucket = int((math.log10(seconds) - MIN_EXPONENT) * BUCKETS_PER_DECADE)
+            bucket = min(max(bucket, 0), NUM_BUCKETS - 1)
+        else:
+            bucket = 0
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket containing the `q`-th percentile."""
+        target = q / 100 * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if count > 0 and cumulative >= target:
+                return 10 ** (MIN_EXPONENT + (bucket + 1) / BUCKETS_PER_DECADE)
+        return 0.0
+
+    def summary(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+            'last': self.last,
+        }
+
+
+class Timer:
+    """Context manager that records its duration into a histogram."""
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.record(perf_counter() - self.start)
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Profiler:
+    """Histograms of timings keyed by (category, name)."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lap_start = None
+
+    def histogram(self, category: str, name: str) -> Histogram:
+        key = (category, name)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        return self.histograms[key]
+
+    def measure(self, category: str, name: str):
+        """Time a block, e.g., `with PROFILER.measure('frame', 'flip'): ...`."""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.histogram(category, name))
+
+    def lap(self, category: str, name: str):
+        """Record the time since the previous lap, e.g., for phases of a frame."""
+        now = perf_counter()
+        if self.enabled and self.lap_start is not None:
+            self.histogram(category, name).record(now - self.lap_start)
+        self.lap_start = now
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        output = {}
+        for (category, name), histogram in self.histograms.items():
+            output.setdefault(category, {})[name] = histogram.summary()
+        return output
+
+    def dump(self, filename: str):
+        """Write summaries and raw bucket counts to a JSON file."""
+        output = {
+            'buckets': {
+                'per_decade': BUCKETS_PER_DECADE,
+                'min_exponent': MIN_EXPONENT,
+                'max_exponent': MAX_EXPONENT,
+            },
+            'summary': self.summary(),
+            'counts': {
+                f'{category}/{name}': histogram.counts
+                for (category, name), histogram in self.histograms.items()
+            },
+        }
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as file:
+            json.dump(output, file, indent=2)
+
+    def reset(self):
+        self.histograms = {}
+
+
+PROFILER = Profiler()
+
+
+def profiled(category: str, name: Callable[[object], str]):
+    """Decorate a method so that its calls are timed when profiling is on.
+
+    `name` gets the instance and returns the name to record under.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not PROFILER.enabled:
+                return method(self, *args, **kwargs)
+            with Timer(PROFILER.histogram(category, name(self))):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,14 +1,21 @@
 import logging
+import os
 from datetime import datetime
 
+import numpy as np
 import pygame
 from dotenv import dotenv_values
 
-from console.components.base import Container, Text, Meter
-from console.components.composite import TextInBorder, AnnotatedLinePlots
+from console.components.base import Container, Text, Meter, Image
+from console.components.compositor import Compositor
+from console.components.composite import TextInBorder, AnnotatedLinePlots, ProfilerOverlay
 from console.components.solar import SunPath
 from console.components.ca import HexCA3
 from console.data import fake, weather, iaq
+from console.data.cache import CACHE_DIR_VARIABLE, cache_dir
+from console.data.aio import ASYNC_POOL
+from console.data.source import SCHEDULER
+from console.profiler import PROFILER
 
 
 # TODO
@@ -34,228 +41,311 @@ BLUE = (19,62,124)
 RED = (234,0,217)
 PURPLE = (113,28,145)
 
+# Data source status indicators; in-flight and retrying sources are purple
+STATUS_COLORS = {'idle': GREEN, 'open': RED}
+
 FPS = int(config.get('FPS', 4))
 FONT = config.get('FONT', '3270medium')
+# 'threads' polls sources from the main loop, 'asyncio' polls them on timers
+DATA_BACKEND = config.get('DATA_BACKEND', 'threads')
+# Decode weather responses in a worker process (threads backend only)
+ISOLATE_WEATHER = config.get('ISOLATE_WEATHER', '0') == '1'
+# Directory for persisted data source history, disabled if unset
+HISTORY_DIR = config.get('HISTORY_DIR')
+# Comma-separated AirGradient serial numbers; more than one shows the fleet aggregate
+IAQ_DEVICES = [serial_no for serial_no in config.get('IAQ_DEVICES', '').split(',') if serial_no]
+# Directory for cached responses and profiles, the user cache directory if unset
+CACHE_DIR = config.get('CACHE_DIR')
+# Profiling can also be toggled with 'p', and dumped to PROFILE_FILE with 'd'
+PROFILE = config.get('PROFILE', '0') == '1'
+PROFILE_FILE = config.get('PROFILE_FILE')
+# CA generations per frame, and frames to simulate ahead on a background thread
+CA_GENERATIONS = int(config.get('CA_GENERATIONS', 1))
+CA_PRECOMPUTE = int(config.get('CA_PRECOMPUTE', 0))
 
 # print(pygame.font.get_fonts())
 
-# pygame setup
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.FULLSCREEN | pygame.NOFRAME)
-clock = pygame.time.Clock()
-running = True
-
-color_fg, color_bg = pygame.Color(*GREEN), pygame.Color(*BLACK)
-
-text_params = {
-    'font_name': FONT,
-    'font_size': 32,
-    'font_color': GREEN,
-    'font_background': BLACK,
-}
-container_params = {
-    'border_thickness': 2,
-    'border_radius': 10,
-    'border_margin': 10,
-    'border_color': GREEN,
-    'background_color': BLACK,
-    'child_padding': 15,
-}
-
-# Setup data sources
-fake_data_source = fake.make_data_source()
-weather_data_source = weather.make_data_source()
-iaq_data_source = iaq.make_data_source()
-
-# Setup computational components
-sun_path_component = SunPath(
-    500, GREEN, BLACK, RED,
-    container_params['border_thickness'], container_params['border_radius']
-)
-ca_component = HexCA3(
-    50, 35,
-    'spiral',
-    {0: GREEN, 1: RED, 2: PURPLE},
-    BLACK, GREEN, 10
-)
-
-dt = 0
-
-while running:
-    # poll for events
-    # pygame.QUIT event means the user clicked X to close your window
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_q:
-                running = False
-            elif event.key == pygame.K_r:
-                ca_component.reinitialize()
-
+def main():
+    # Set before any worker process starts, so that the workers see it too
+    if CACHE_DIR:
+        os.environ[CACHE_DIR_VARIABLE] = CACHE_DIR
+    profile_file = PROFILE_FILE or cache_dir('profile.json')
 
-    # update data sources
-    weather_data = weather_data_source.update()
-    iaq_data = iaq_data_source.update()
+    # pygame setup
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.FULLSCREEN | pygame.NOFRAME)
+    clock = pygame.time.Clock()
+    running = True
 
-    # fill the screen with a color to wipe away anything from last frame
-    screen.fill(color_bg)
+    color_fg, color_bg = pygame.Color(*GREEN), pygame.Color(*BLACK)
 
-    # Make title
-    params = {
+    text_params = {
         'font_name': FONT,
-        'font_size': 56,
+        'font_size': 32,
         'font_color': GREEN,
         'font_background': BLACK,
     }
-    title = Text('SHED DASHBOARD 082824', **params)
-
-    # Make clock
-    params['font_size'] = 24
-    date = Text(datetime.now().strftime('%Y-%m-%d %I:%M:%S'), **params)
-
-    # Show data source statuses
-    data_source_status = [
-        weather_data_source.status,
-        iaq_data_source.status,
-    ]
-    status_surface = pygame.Surface((len(data_source_status) * 30, 30))
-    status_surface.fill(color_bg)
-    for i, status in enumerate(data_source_status):
-        color = pygame.Color(*GREEN) if status == 'idle' else pygame.Color(*RED)
-        indicaor = pygame.draw.rect(status_surface, color, (5 + 30 * i, 5, 20, 20))
-
-    # Offset to start of main dashboard
-    origin_y = title.height + 10
-    origin_x = 10
+    container_params = {
+        'border_thickness': 2,
+        'border_radius': 10,
+        'border_margin': 10,
+        'border_color': GREEN,
+        'background_color': BLACK,
+        'child_padding': 15,
+    }
 
-    # Weather data
-    weather_data_fmt = weather.present_data(weather_data.get('current', {}))
-    container_weather = TextInBorder(weather_data_fmt, text_params, container_params)
-
-    # Weather forecast
-    forecast_temp = weather_data.get('hourly', {}).get('Temp [F]', [])
-    forecast_cloud = weather_data.get('hourly', {}).get('Cloud Cover [%]', [])
-    forecast_precip = weather_data.get('hourly', {}).get('Precip Prob [%]', [])
-    forecast_wind = weather_data.get('hourly', {}).get('Wind Speed [mph]', [])
-    forecast_time_ind = list(range(len(forecast_temp)))
-    forecast_plots = AnnotatedLinePlots(
-        ['TEMP','CLCO','PREC','WIND'],
-        forecast_time_ind,
-        [forecast_temp, forecast_cloud, forecast_precip, forecast_wind],
-        text_params,
-        container_params
+    # Setup data sources
+    fake_data_source = fake.make_data_source()
+    iaq_fleet = None
+    if DATA_BACKEND == 'asyncio':
+        weather_data_source = weather.make_async_data_source()
+    else:
+        weather_data_source = weather.make_data_source(isolated=ISOLATE_WEATHER)
+    if len(IAQ_DEVICES) > 1:
+        # A fleet always polls on the asyncio backend, whatever DATA_BACKEND
+        iaq_fleet = iaq.Fleet(IAQ_DEVICES, HISTORY_DIR)
+    elif DATA_BACKEND == 'asyncio':
+        iaq_data_source = iaq.make_async_data_source(*IAQ_DEVICES[:1], log_dir=HISTORY_DIR)
+    else:
+        iaq_data_source = iaq.make_data_source(*IAQ_DEVICES[:1], log_dir=HISTORY_DIR)
+    # Fleet devices are added to the scheduler by the fleet
+    SCHEDULER.add(weather_data_source)
+    if iaq_fleet is None:
+        SCHEDULER.add(iaq_data_source)
+
+    # Setup computational components
+    sun_path_component = SunPath(
+        500, GREEN, BLACK, RED,
+        container_params['border_thickness'], container_params['border_radius']
+    )
+    ca_component = HexCA3(
+        50, 35,
+        'spiral',
+        {0: GREEN, 1: RED, 2: PURPLE},
+        BLACK, GREEN, 10,
+        generations_per_frame=CA_GENERATIONS,
+        precompute=CA_PRECOMPUTE
     )
 
-    # IAQ data
-    iaq_data_fmt = iaq.present_data(iaq_data)
-    container_iaq = TextInBorder(iaq_data_fmt, text_params, container_params)
+    compositor = Compositor(screen, BLACK)
+    origin_x = 10
+    PROFILER.enabled = PROFILE
 
-    # IAQ history
-    if len(iaq_data_source.history) < 2:
-        iaq_utc_times = []
-        iaq_history = []
-    else:
-        iaq_utc_times, iaq_history = zip(*iaq_data_source.history)
-    n_points = len(iaq_utc_times)
-    temp_data = [data['Temperature [F]'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    humidity_data = [data['Rel Hum [%]'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    c02_data = [data['CO2 [ppm]'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    pm25_data = [data['PM2.5 [ug/m3]'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    tvoc_data = [data['VOC Index'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    nox_data = [data['NOx Index'] for data in iaq_history] #+ [0]*(iaq_data_source.max_history_len - n_points)
-    iaq_plots = AnnotatedLinePlots(
-        ['TEMP', ' CO2', 'PM25', ' VOC', ' NOx'],
-        list(range(n_points)),
-        [temp_data, c02_data, pm25_data, tvoc_data, nox_data],
-        text_params,
-        container_params
-    )
+    dt = 0
 
-    # Elapsed time meters
-    now = datetime.now()
-
-    time_elapsed = now - datetime(now.year, 1, 1)
-    fraction_elapsed_year = time_elapsed.total_seconds() / (60*60*24*365)
-
-    time_elapsed = now - datetime(now.year, now.month, 1)
-    fraction_elapsed_month = time_elapsed.total_seconds() / (60*60*24*30)
-
-    time_elapsed = now - datetime(now.year, now.month, now.day)
-    fraction_elapsed_day = time_elapsed.total_seconds() / (60*60*24)
-
-    pad = 10
-    width = 10
-    height = HEIGHT - origin_y - 20
-    meter_day = Meter(width, height, fraction_elapsed_day, 1, 0, color_fg, color_bg)
-    meter_month = Meter(width, height, fraction_elapsed_month, 1, 0, color_fg, color_bg)
-    meter_year = Meter(width, height, fraction_elapsed_year, 1, 0, color_fg, color_bg)
-    container_elapsed_time = Container(
-        3*width+4*pad, height+2*pad,
-        [meter_day, meter_month, meter_year],
-        border_thickness=0, border_radius=0, border_margin=0,
-        border_color=color_bg, background_color=color_bg, child_padding=pad
-    )
+    while running:
+        # poll for events
+        # pygame.QUIT event means the user clicked X to close your window
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_q:
+                    running = False
+                elif event.key == pygame.K_r:
+                    ca_component.reinitialize()
+                elif event.key == pygame.K_p:
+                    PROFILER.enabled = not PROFILER.enabled
+                elif event.key == pygame.K_d:
+                    PROFILER.dump(profile_file)
+        PROFILER.lap('frame', 'events')
+
+        # update the data sources that are due; components are only rebuilt
+        # when the version of their data changes
+        SCHEDULER.update()
+        weather_data = weather_data_source.data
+        if iaq_fleet is None:
+            iaq_data = iaq_data_source.data
+            iaq_version = iaq_data_source.version
+        else:
+            iaq_aggregate = iaq_fleet.update()
+            iaq_version = iaq_fleet.version
+        PROFILER.lap('frame', 'data')
+
+        # Make title
+        params = {
+            'font_name': FONT,
+            'font_size': 56,
+            'font_color': GREEN,
+            'font_background': BLACK,
+        }
+        title = compositor.place('title', (origin_x, 10), None, lambda: Text('SHED DASHBOARD 082824', **params))
+
+        # Make clock
+        date_params = {**params, 'font_size': 24}
+        date_str = datetime.now().strftime('%Y-%m-%d %I:%M:%S')
+        date = compositor.place(
+            'date', lambda date: (WIDTH-10-date.width, 10), date_str,
+            lambda: Text(date_str, **date_params)
+        )
 
-    # Sun path
-    sun_path = sun_path_component.get_surface()
+        # Show data source statuses, one per IAQ device in a fleet
+        data_source_status = (
+            weather_data_source.status,
+            *([iaq_data_source.status] if iaq_fleet is None else iaq_fleet.statuses().values()),
+        )
+        def make_status():
+            status_surface = pygame.Surface((len(data_source_status) * 30, 30))
+            status_surface.fill(color_bg)
+            for i, status in enumerate(data_source_status):
+                color = pygame.Color(*STATUS_COLORS.get(status, PURPLE))
+                indicaor = pygame.draw.rect(status_surface, color, (5 + 30 * i, 5, 20, 20))
+            return Image(status_surface)
+        compositor.place(
+            'status', (WIDTH-len(data_source_status)*30-10, date.height + 10),
+            data_source_status, make_status
+        )
 
-    # CA
-    cell_aut = ca_component.get_surface()
+        # Offset to start of main dashboard
+        origin_y = title.height + 10
 
-    screen.blit(
-        title.get_surface(),
-        (origin_x, 10)
-    )
-    screen.blit(
-        date.get_surface(),
-        (WIDTH-10-date.width, 10)
-    )
-    screen.blit(
-        status_surface,
-        (WIDTH-status_surface.get_width()-10, date.height + 10)
-    )
+        # Weather data
+        container_weather = compositor.place(
+            'weather', (origin_x, origin_y), weather_data_source.version,
+            lambda: TextInBorder(weather.present_data(weather_data.get('current', {})), text_params, container_params)
+        )
 
-    screen.blit(
-        container_weather.get_surface(),
-        (origin_x, origin_y)
-    )
-    screen.blit(
-        forecast_plots.get_surface(),
-        (origin_x + container_weather.width + 15, origin_y)
-    )
-    screen.blit(
-        container_iaq.get_surface(),
-        (origin_x, origin_y + container_weather.height + 10)
+        # Weather forecast
+        def make_forecast_plots():
+            forecast_temp = weather_data.get('hourly', {}).get('Temp [F]', [])
+            forecast_cloud = weather_data.get('hourly', {}).get('Cloud Cover [%]', [])
+            forecast_precip = weather_data.get('hourly', {}).get('Precip Prob [%]', [])
+            forecast_wind = weather_data.get('hourly', {}).get('Wind Speed [mph]', [])
+            forecast_time_ind = list(range(len(forecast_temp)))
+            return AnnotatedLinePlots(
+                ['TEMP','CLCO','PREC','WIND'],
+                forecast_time_ind,
+                [forecast_temp, forecast_cloud, forecast_precip, forecast_wind],
+                text_params,
+                container_params
+            )
+        forecast_plots = compositor.place(
+            'forecast', (origin_x + container_weather.width + 15, origin_y),
+            weather_data_source.version, make_forecast_plots
         )
-    screen.blit(
-        iaq_plots.get_surface(),
-        (origin_x + container_iaq.width + 15, origin_y + container_weather.height + 10 + container_iaq.height - iaq_plots.height)
+
+        # IAQ data
+        container_iaq = compositor.place(
+            'iaq', (origin_x, origin_y + container_weather.height + 10), iaq_version,
+            lambda: TextInBorder(
+                iaq.present_data(iaq_data) if iaq_fleet is None else iaq.present_aggregate(iaq_aggregate),
+                text_params, container_params
+            )
         )
-    screen.blit(
-        container_elapsed_time.get_surface(),
-        (WIDTH - container_elapsed_time.width - 10, origin_y)
-    )
-    screen.blit(
-        sun_path,
-        (
-            origin_x + container_weather.width + 15,
-            origin_y + forecast_plots.height + 10)
-    )
-    screen.blit(
-        cell_aut,
-        (
-            origin_x + container_weather.width + 15 + sun_path.get_width() + 20,
-            origin_y
+
+        # IAQ history, or the CO2 history of every device in a fleet
+        def make_iaq_plots():
+            if iaq_fleet is not None:
+                histories = [device.history for device in iaq_fleet.devices.values()]
+                n_points = min(len(history) for history in histories)
+                n_points = n_points if n_points >= 2 else 0
+                return AnnotatedLinePlots(
+                    [serial_no[-4:].upper() for serial_no in iaq_fleet.devices],
+                    np.arange(n_points),
+                    [history.column('CO2 [ppm]', n_points) for history in histories],
+                    text_params,
+                    container_params
+                )
+            iaq_history = iaq_data_source.history
+            n_points = len(iaq_history) if len(iaq_history) >= 2 else 0
+            fields = ['Temperature [F]', 'CO2 [ppm]', 'PM2.5 [ug/m3]', 'VOC Index', 'NOx Index']
+            return AnnotatedLinePlots(
+                ['TEMP', ' CO2', 'PM25', ' VOC', ' NOx'],
+                np.arange(n_points),
+                [iaq_history.column(field, n_points) for field in fields],
+                text_params,
+                container_params,
+                y_stats=[iaq_history.stats(field) for field in fields] if n_points > 0 else None
+            )
+        iaq_plots = compositor.place(
+            'iaq_plots',
+            lambda iaq_plots: (
+                origin_x + container_iaq.width + 15,
+                origin_y + container_weather.height + 10 + container_iaq.height - iaq_plots.height
+            ),
+            iaq_version, make_iaq_plots
         )
-    )
 
-    # flip() the display to put your work on screen
-    pygame.display.flip()
+        # Elapsed time meters
+        now = datetime.now()
+
+        time_elapsed = now - datetime(now.year, 1, 1)
+        fraction_elapsed_year = time_elapsed.total_seconds() / (60*60*24*365)
+
+        time_elapsed = now - datetime(now.year, now.month, 1)
+        fraction_elapsed_month = time_elapsed.total_seconds() / (60*60*24*30)
+
+        time_elapsed = now - datetime(now.year, now.month, now.day)
+        fraction_elapsed_day = time_elapsed.total_seconds() / (60*60*24)
+
+        pad = 10
+        width = 10
+        height = HEIGHT - origin_y - 20
+        def make_elapsed_time():
+            meter_day = Meter(width, height, fraction_elapsed_day, 1, 0, color_fg, color_bg)
+            meter_month = Meter(width, height, fraction_elapsed_month, 1, 0, color_fg, color_bg)
+            meter_year = Meter(width, height, fraction_elapsed_year, 1, 0, color_fg, color_bg)
+            return Container(
+                3*width+4*pad, height+2*pad,
+                [meter_day, meter_month, meter_year],
+                border_thickness=0, border_radius=0, border_margin=0,
+                border_color=color_bg, background_color=color_bg, child_padding=pad
+            )
+        # Only rebuild the meters when one of them moves by a pixel
+        elapsed_pixels = tuple(
+            int(height * fraction)
+            for fraction in (fraction_elapsed_day, fraction_elapsed_month, fraction_elapsed_year)
+        )
+        compositor.place(
+            'elapsed_time', (WIDTH - (3*width+4*pad) - 10, origin_y),
+            elapsed_pixels, make_elapsed_time
+        )
+
+        # Sun path, redrawn once per minute
+        sun_path = compositor.place(
+            'sun_path', (origin_x + container_weather.width + 15, origin_y + forecast_plots.height + 10),
+            now.strftime('%H:%M'), lambda: sun_path_component
+        )
+
+        # CA, redrawn every frame
+        compositor.place(
+            'ca', (origin_x + container_weather.width + 15 + sun_path.width + 20, origin_y),
+            None, lambda: ca_component
+        )
+
+        # Profiler overlay, refreshed once per second
+        if PROFILER.enabled:
+            compositor.place(
+                'profiler', lambda overlay: (WIDTH - overlay.width - 60, HEIGHT - overlay.height - 10),
+                int(now.timestamp()),
+                lambda: ProfilerOverlay(PROFILER, {**text_params, 'font_size': 16}, container_params)
+            )
+        else:
+            compositor.remove('profiler')
+        PROFILER.lap('frame', 'layout')
+
+        # Only push the parts of the display that changed
+        changed_rects = compositor.draw()
+        PROFILER.lap('frame', 'draw')
+        pygame.display.update(changed_rects)
+        PROFILER.lap('frame', 'flip')
+
+        # limits FPS
+        # dt is delta time in seconds since last frame, used for framerate-
+        # independent physics.
+        dt = clock.tick(FPS) / 1000
+        PROFILER.lap('frame', 'idle')
+
+    ca_component.close()
+    ASYNC_POOL.shutdown()
+    if iaq_fleet is None:
+        iaq_data_source.close()
+    else:
+        iaq_fleet.close()
+    pygame.quit()
 
-    # limits FPS
-    # dt is delta time in seconds since last frame, used for framerate-
-    # independent physics.
-    dt = clock.tick(FPS) / 1000
 
-pygame.quit()
+# Worker processes of isolated data sources import this script, so only
+# run the dashboard as the main program
+if __name__ == '__main__':
+    main()
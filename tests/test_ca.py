@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from console.components.ca import (
+    RULES,
+    HexSimulation,
+    count_hex_states,
+    get_neighbors,
+    get_topology,
+    make_rule_table,
+)
+
+
+STATE_VALUES = (0, 1, 2)
+SHAPES = [(50, 35), (7, 5), (2, 3), (1, 4)]
+
+
+def reference_step(hex_states: list, neighbors: list, rules: dict, include_self: bool):
+    """Advance one generation with the scalar `count_hex_states`."""
+    new_states = []
+    for index in range(len(hex_states)):
+        counts = count_hex_states(index, hex_states, neighbors, STATE_VALUES, include_self)
+        new_states.append(rules[tuple(counts[state] for state in STATE_VALUES)])
+    return new_states
+
+
+def make_simulation(rule: str, num_rows: int, num_cols: int, seed: int, **kwargs):
+    random.seed(seed)
+    rules, include_self = RULES[rule](STATE_VALUES)
+    neighbors = get_neighbors(num_rows, num_cols)
+    hex_states = np.random.default_rng(seed).integers(0, len(STATE_VALUES), len(neighbors))
+    simulation = HexSimulation(
+        hex_states,
+        get_topology(num_rows, num_cols),
+        make_rule_table(rules, STATE_VALUES, include_self),
+        include_self,
+        **kwargs
+    )
+    return simulation, hex_states.tolist(), neighbors, rules, include_self
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_topology_matches_neighbors(shape):
+    neighbors = get_neighbors(*shape)
+    topology = get_topology(*shape)
+    hexes = np.arange(len(neighbors))
+    rows, indices = topology.gather(hexes[::2])
+    expected = [neighbors[index] for index in hexes[::2]]
+    assert [indices[rows == row].tolist() for row in range(len(expected))] == expected
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_gather_all_hexes(shape):
+    neighbors = get_neighbors(*shape)
+    topology = get_topology(*shape)
+    rows, indices = topology.gather(None)
+    assert [indices[rows == row].tolist() for row in range(len(neighbors))] == neighbors
+
+    # As many hexes as the grid has, but not in order
+    hexes = np.arange(len(neighbors))[::-1]
+    rows, indices = topology.gather(hexes)
+    assert [indices[rows == row].tolist() for row in range(len(hexes))] == [neighbors[index] for index in hexes]
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('rule', sorted(RULES))
+def test_simulation_matches_reference(rule, shape):
+    simulation, hex_states, neighbors, rules, include_self = make_simulation(rule, *shape, seed=1)
+    for _ in range(30):
+        previous_states = simulation.hex_states.copy()
+        changed = simulation.step()
+        hex_states = reference_step(hex_states, neighbors, rules, include_self)
+
+        assert simulation.hex_states.tolist() == hex_states
+        assert changed.tolist() == np.flatnonzero(simulation.hex_states != previous_states).tolist()
+        assert simulation.total_counts.tolist() == np.bincount(hex_states, minlength=len(STATE_VALUES)).tolist()
+
+
+# Seeds whose automaton enters a cycle longer than one generation
+@pytest.mark.parametrize('rule, shape, seed', [
+    ('random', (2, 3), 0),
+    ('random', (7, 5), 7),
+    ('spiral', (2, 3), 25),
+    ('spiral', (4, 3), 3),
+])
+def test_replay_matches_reference(rule, shape, seed):
+    simulation, hex_states, neighbors, rules, include_self = make_simulation(rule, *shape, seed=seed, replay=True)
+    for _ in range(150):
+        simulation.step()
+        hex_states = reference_step(hex_states, neighbors, rules, include_self)
+        assert simulation.hex_states.tolist() == hex_states
+        assert simulation.total_counts.tolist() == np.bincount(hex_states, minlength=len(STATE_VALUES)).tolist()
+    assert simulation.cycle is not None
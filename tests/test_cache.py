@@ -0,0 +1,20 @@
+import os
+
+from console.data.cache import CACHE_DIR_VARIABLE, ResponseCache, cache_dir
+
+
+def test_cache_dir_defaults_to_the_user_cache(monkeypatch, tmp_path):
+    monkeypatch.delenv(CACHE_DIR_VARIABLE, raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert cache_dir('weather') == os.path.join(str(tmp_path), 'console', 'weather')
+
+
+def test_cache_follows_the_environment(monkeypatch, tmp_path):
+    cache = ResponseCache('weather', ttl=60)
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path))
+    key = cache.key('https://example.com', {'a': 1})
+    cache.store(key, b'payload', etag='"v1"')
+
+    assert (tmp_path / 'weather' / f'{key}.bin').read_bytes() == b'payload'
+    assert cache.load(key, max_age=60) == b'payload'
+    assert cache.conditional_headers(key) == {'If-None-Match': '"v1"'}
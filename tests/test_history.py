@@ -0,0 +1,84 @@
+import datetime as dt
+import math
+
+import numpy as np
+import pytest
+
+from console.data.history import EPOCH, RingBuffer, RollingStats
+
+
+def timestamp(i: int) -> dt.datetime:
+    return EPOCH + dt.timedelta(seconds=i)
+
+
+def test_rolling_stats_over_a_sliding_window():
+    values = [5.0, 3.0, math.nan, 8.0, 1.0, 4.0, 4.0, 9.0, 2.0]
+    window = 3
+    stats = RollingStats()
+    for seq, value in enumerate(values):
+        if seq >= window:
+            stats.evict(seq - window, values[seq - window])
+        stats.push(seq, value)
+
+        current = [v for v in values[max(0, seq - window + 1):seq + 1] if not math.isnan(v)]
+        assert stats.get() == pytest.approx((min(current), sum(current) / len(current), max(current)))
+
+
+def test_rolling_stats_empty_is_nan():
+    stats = RollingStats()
+    stats.push(0, 1.0)
+    stats.evict(0, 1.0)
+    assert all(math.isnan(value) for value in stats.get())
+
+
+def test_ring_buffer_wraps_around():
+    history = RingBuffer(4, ['a', 'b'])
+    for i in range(10):
+        history.append(timestamp(i), {'a': float(i), 'b': 'not a number'})
+
+    assert len(history) == 4
+    assert history.column('a').tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert np.isnan(history.column('b')).all()
+    assert history.column('a', 2).tolist() == [8.0, 9.0]
+    assert history.timestamps().astype('datetime64[s]').astype(np.int64).tolist() == [6, 7, 8, 9]
+    assert history.stats('a') == (6.0, 7.5, 9.0)
+    last_timestamp, last_record = history.last()
+    assert last_timestamp == timestamp(9) and last_record['a'] == 9.0
+    assert history.last_row()[1] == 9.0
+
+
+def test_ring_buffer_columns_are_read_only_views():
+    history = RingBuffer(3, ['a'])
+    history.append(timestamp(0), {'a': 1.0})
+    column = history.column('a')
+    with pytest.raises(ValueError):
+        column[0] = 2.0
+
+
+def test_ring_buffer_fields_from_first_record():
+    history = RingBuffer(2)
+    history.append(timestamp(0), {'a': 1, 'flag': True, 'name': 'x', 'b': 2.5})
+    assert history.fields == ['a', 'b']
+    assert history.column('missing').size == 0
+    assert all(math.isnan(value) for value in history.stats('missing'))
+
+
+def test_ring_buffer_extend_matches_append():
+    appended, extended = RingBuffer(5, ['a']), RingBuffer(5, ['a'])
+    for i in range(3):
+        appended.append(timestamp(i), {'a': float(i)})
+        extended.append(timestamp(i), {'a': float(i)})
+
+    timestamps_ns = np.arange(3, 10, dtype=np.int64) * 10**9
+    values = np.arange(3, 10, dtype=np.float64)
+    for i in range(3, 10):
+        appended.append(timestamp(i), {'a': float(i)})
+    extended.extend(timestamps_ns, {'a': values})
+
+    assert extended.column('a').tolist() == appended.column('a').tolist()
+    assert extended.timestamps().tolist() == appended.timestamps().tolist()
+    assert extended.stats('a') == appended.stats('a')
+
+    # The rolling stats keep evicting correctly after a bulk extend
+    extended.append(timestamp(10), {'a': 0.0})
+    assert extended.stats('a') == (0.0, 6.0, 9.0)
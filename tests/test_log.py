@@ -0,0 +1,88 @@
+import datetime as dt
+
+import numpy as np
+
+from console.data.history import RingBuffer
+from console.data.log import HistoryLog
+
+
+def fill(history: RingBuffer, log: HistoryLog, values: range, start: dt.datetime, fields=('a',)):
+    for value in values:
+        history.append(start + dt.timedelta(seconds=value), {field: float(value) for field in fields})
+        log.append(history)
+
+
+def test_replay_across_restarts(tmp_path):
+    path = str(tmp_path / 'source.log')
+    start = dt.datetime.now(dt.UTC) - dt.timedelta(minutes=1)
+
+    history, log = RingBuffer(10, ['a']), HistoryLog(path, retention=3600, capacity=10, batch_size=4)
+    fill(history, log, range(6), start)
+    # Only whole batches are on disk until the log is flushed
+    assert log.read()['a'].tolist() == [0.0, 1.0, 2.0, 3.0]
+    log.flush()
+
+    restored = RingBuffer(10, ['a'])
+    HistoryLog(path, retention=3600, capacity=10).replay(restored)
+    assert restored.column('a').tolist() == history.column('a').tolist()
+    assert restored.timestamps().tolist() == history.timestamps().tolist()
+    assert restored.stats('a') == history.stats('a')
+
+
+def test_compaction_keeps_the_newest_records(tmp_path):
+    path = str(tmp_path / 'source.log')
+    start = dt.datetime.now(dt.UTC) - dt.timedelta(minutes=1)
+
+    history, log = RingBuffer(5, ['a']), HistoryLog(path, retention=3600, capacity=5, batch_size=1)
+    fill(history, log, range(11), start)
+    # Compacted once the file held more than twice the capacity
+    assert log.read()['a'].tolist() == [6.0, 7.0, 8.0, 9.0, 10.0]
+
+    restored = RingBuffer(5, ['a'])
+    HistoryLog(path, retention=3600, capacity=5).replay(restored)
+    assert restored.column('a').tolist() == [6.0, 7.0, 8.0, 9.0, 10.0]
+
+
+def test_replay_drops_expired_records(tmp_path):
+    path = str(tmp_path / 'source.log')
+    now = dt.datetime.now(dt.UTC)
+
+    history, log = RingBuffer(10, ['a']), HistoryLog(path, retention=3600, capacity=10, batch_size=1)
+    fill(history, log, range(3), now - dt.timedelta(hours=2))
+    fill(history, log, range(3, 5), now - dt.timedelta(seconds=10))
+
+    restored = RingBuffer(10, ['a'])
+    HistoryLog(path, retention=3600, capacity=10).replay(restored)
+    assert restored.column('a').tolist() == [3.0, 4.0]
+    # The file itself was compacted on replay
+    assert len(HistoryLog(path, retention=3600, capacity=10).read()) == 2
+
+
+def test_replay_into_new_fields(tmp_path):
+    path = str(tmp_path / 'source.log')
+    start = dt.datetime.now(dt.UTC) - dt.timedelta(minutes=1)
+
+    history, log = RingBuffer(10, ['a']), HistoryLog(path, retention=3600, capacity=10, batch_size=1)
+    fill(history, log, range(3), start)
+
+    restored = RingBuffer(10, ['a', 'b'])
+    log = HistoryLog(path, retention=3600, capacity=10, batch_size=1)
+    log.replay(restored)
+    assert restored.column('a').tolist() == [0.0, 1.0, 2.0]
+    assert np.isnan(restored.column('b')).all()
+
+    # The file is rewritten in the new layout, so new records fit
+    fill(restored, log, range(3, 4), start, fields=('a', 'b'))
+    assert log.read().dtype.names == ('timestamp', 'a', 'b')
+    assert log.read()['b'].tolist()[-1] == 3.0
+
+
+def test_missing_or_corrupt_file(tmp_path):
+    path = tmp_path / 'source.log'
+    history = RingBuffer(5, ['a'])
+    HistoryLog(str(path), retention=3600, capacity=5).replay(history)
+    assert len(history) == 0
+
+    path.write_bytes(b'not a log at all')
+    HistoryLog(str(path), retention=3600, capacity=5).replay(history)
+    assert len(history) == 0
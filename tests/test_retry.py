@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from console.data.retry import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, RetryPolicy
+
+
+def test_backoff_is_capped_exponential():
+    random.seed(0)
+    policy = RetryPolicy(base_delay=1, max_delay=10)
+    for failures, ceiling in [(1, 1), (2, 2), (3, 4), (4, 8), (5, 10), (100, 10)]:
+        delays = [policy.backoff(failures) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= ceiling
+        assert max(delays) > ceiling / 2
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(RetryPolicy(base_delay=1, max_delay=10, failure_threshold=3, open_duration=100))
+    assert breaker.allow(now=0)
+
+    delay = breaker.record_failure(now=0)
+    assert breaker.state == CLOSED and delay <= 1
+    assert breaker.retry_at == delay
+    assert breaker.allow(now=delay)
+
+    breaker.record_failure(now=1)
+    assert breaker.record_failure(now=2) == 100
+    assert breaker.state == OPEN
+    assert not breaker.allow(now=101)
+    assert breaker.allow(now=102)
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(RetryPolicy(failure_threshold=1, open_duration=10))
+    breaker.record_failure(now=0)
+    assert breaker.state == OPEN
+
+    assert breaker.allow(now=10)
+    assert breaker.state == HALF_OPEN
+    # A failed trial opens the circuit again for the whole duration
+    assert breaker.record_failure(now=10) == 10
+    assert breaker.state == OPEN
+
+    assert breaker.allow(now=20)
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert breaker.allow(now=20)
+
+
+@pytest.mark.parametrize('failures', [1, 2])
+def test_success_resets_the_failure_count(failures):
+    breaker = CircuitBreaker(RetryPolicy(failure_threshold=3))
+    for _ in range(failures):
+        breaker.record_failure(now=0)
+    breaker.record_success()
+    breaker.record_failure(now=0)
+    breaker.record_failure(now=0)
+    assert breaker.state == CLOSED
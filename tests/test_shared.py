@@ -0,0 +1,55 @@
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from console.data import shared
+from console.data.source import DataRetriever
+
+
+def test_round_trip_frees_the_block():
+    result = {
+        'name': 'site',
+        'hourly': {'temperature': np.linspace(0, 1, 7, dtype=np.float32), 'code': np.arange(5)},
+        'daily': [np.ones((2, 3)), (np.array([True, False]), 'x')],
+        'labels': np.array(['a', 'b'], dtype=object),
+    }
+    name, skeleton = shared.pack(result)
+    assert name is not None
+    assert isinstance(skeleton['hourly']['temperature'], shared.SharedArray)
+    assert skeleton['labels'] is result['labels']
+    assert all(array.offset % shared.ALIGNMENT == 0 for array in [
+        skeleton['hourly']['temperature'], skeleton['hourly']['code'], skeleton['daily'][0], skeleton['daily'][1][0]
+    ])
+
+    restored = shared.unpack(name, skeleton)
+    assert restored['name'] == 'site'
+    for got, expected in [
+        (restored['hourly']['temperature'], result['hourly']['temperature']),
+        (restored['hourly']['code'], result['hourly']['code']),
+        (restored['daily'][0], result['daily'][0]),
+        (restored['daily'][1][0], result['daily'][1][0]),
+    ]:
+        assert got.dtype == expected.dtype and np.array_equal(got, expected)
+    assert isinstance(restored['daily'][1], tuple)
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_results_without_arrays_skip_shared_memory():
+    result = {'a': 1, 'b': [2.0, 'three']}
+    name, skeleton = shared.pack(result)
+    assert name is None and skeleton == result
+    assert shared.unpack(name, skeleton) == result
+
+
+def test_isolated_request_round_trip():
+    retriever = DataRetriever(timeout=30)
+    try:
+        future = retriever.submit('site', partial(dict, values=np.arange(10.0)), isolated=True)
+        result = future.result(timeout=30)
+        assert np.array_equal(result['values'], np.arange(10.0))
+    finally:
+        retriever.shutdown()
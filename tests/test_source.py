@@ -0,0 +1,169 @@
+from typing import Callable
+import threading
+import time
+from concurrent import futures
+
+import pytest
+
+from console.data.source import DROP_OLDEST, DataRetriever, Scheduler
+
+
+class FakeSource:
+    """Just what a `Scheduler` touches on a `DataSource`."""
+
+    def __init__(self, name: str, next_due_ns: int, refresh_ns: int = 100):
+        self.name = name
+        self.next_due_ns = next_due_ns
+        self.refresh_ns = refresh_ns
+        self.pending = False
+        self.scheduler = None
+        self.updates = []
+
+    def update(self, now_ns: int):
+        self.updates.append(now_ns)
+        self.next_due_ns = now_ns + self.refresh_ns
+
+
+def names(sources) -> list[str]:
+    return [source.name for source in sources]
+
+
+def test_sources_are_updated_in_deadline_order():
+    scheduler = Scheduler()
+    sources = [FakeSource('c', 30), FakeSource('a', 10), FakeSource('b', 20), FakeSource('d', 40)]
+    scheduler.add(*sources)
+    assert all(source.scheduler is scheduler for source in sources)
+
+    assert scheduler.update(5) == []
+    assert names(scheduler.update(30)) == ['a', 'b', 'c']
+    assert names(scheduler.update(35)) == []
+    assert names(scheduler.update(130)) == ['d', 'a', 'b', 'c']
+    assert [source.updates for source in sources] == [[30, 130], [30, 130], [30, 130], [130]]
+
+
+def test_moved_deadlines_are_skipped():
+    scheduler = Scheduler()
+    source = FakeSource('a', 10)
+    scheduler.add(source)
+
+    # The stale heap entry at 10 is skipped, and the new one is not due yet
+    source.next_due_ns = 50
+    scheduler.add(source)
+    assert scheduler.update(20) == []
+    assert names(scheduler.update(50)) == ['a']
+    assert source.updates == [50]
+
+
+def test_pending_sources_wait_to_be_woken():
+    scheduler = Scheduler()
+    source = FakeSource('a', 10)
+    source.pending = True
+    scheduler.add(source)
+    assert scheduler.update(100) == []
+
+    # Woken sources are updated once, even if they are also due
+    scheduler.wake(source)
+    scheduler.wake(source)
+    assert names(scheduler.update(100)) == ['a']
+    assert source.updates == [100]
+
+
+def blocker() -> tuple[threading.Event, threading.Event, Callable]:
+    """A request that holds a worker until released."""
+    started, release = threading.Event(), threading.Event()
+
+    def request():
+        started.set()
+        release.wait(5)
+        return {'blocked': True}
+
+    return started, release, request
+
+
+def test_coalesce_returns_the_outstanding_request():
+    retriever = DataRetriever(max_workers=1)
+    started, release, request = blocker()
+    try:
+        first = retriever.submit('a', request)
+        assert retriever.submit('a', lambda: {'second': True}) is first
+        release.set()
+        assert first.result(timeout=5) == {'blocked': True}
+        # Done requests are not coalesced
+        assert retriever.submit('a', lambda: {'third': True}).result(timeout=5) == {'third': True}
+    finally:
+        retriever.shutdown()
+
+
+def test_drop_oldest_replaces_a_running_request():
+    retriever = DataRetriever(max_workers=1, policy=DROP_OLDEST)
+    started, release, request = blocker()
+    try:
+        first = retriever.submit('a', request)
+        assert started.wait(5)
+        second = retriever.submit('a', lambda: {'second': True})
+        with pytest.raises(futures.CancelledError):
+            first.result(timeout=5)
+        # A spare worker runs the replacement while the first is stuck
+        assert second.result(timeout=5) == {'second': True}
+        assert retriever.metrics()['dropped'] == 1
+    finally:
+        release.set()
+        retriever.shutdown()
+
+
+def test_full_queue_drops_the_oldest_waiting_request():
+    retriever = DataRetriever(max_workers=1, max_queued=1)
+    started, release, request = blocker()
+    try:
+        retriever.submit('x', request)
+        assert started.wait(5)
+        oldest = retriever.submit('a', lambda: {'a': True})
+        newest = retriever.submit('b', lambda: {'b': True})
+        assert oldest.cancelled()
+        assert retriever.metrics()['queued'] == 1
+        release.set()
+        assert newest.result(timeout=5) == {'b': True}
+    finally:
+        release.set()
+        retriever.shutdown()
+
+
+def test_timeout_starts_a_spare_worker():
+    retriever = DataRetriever(max_workers=1, timeout=0.1)
+    started, release, request = blocker()
+    try:
+        hung = retriever.submit('a', request)
+        with pytest.raises(TimeoutError):
+            hung.result(timeout=5)
+        assert retriever.submit('b', lambda: {'b': True}).result(timeout=5) == {'b': True}
+        metrics = retriever.metrics()
+        assert metrics['timed_out'] == 1 and metrics['workers'] == 2
+
+        # The hung worker retires once it returns, and its result is discarded
+        release.set()
+        deadline = time.monotonic() + 5
+        while retriever.metrics()['workers'] > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert retriever.metrics()['workers'] == 1
+        assert isinstance(hung.exception(), TimeoutError)
+    finally:
+        release.set()
+        retriever.shutdown()
+
+
+def test_shutdown_cancels_without_waiting():
+    retriever = DataRetriever(max_workers=1)
+    started, release, request = blocker()
+    try:
+        running = retriever.submit('a', request)
+        assert started.wait(5)
+        waiting = retriever.submit('b', lambda: {'b': True})
+
+        start = time.monotonic()
+        retriever.shutdown()
+        assert time.monotonic() - start < 1
+        assert waiting.cancelled()
+        with pytest.raises(futures.CancelledError):
+            running.result(timeout=5)
+    finally:
+        release.set()